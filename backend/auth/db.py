@@ -0,0 +1,55 @@
+'''
+Business: Database connection reused across invocations of a warm function instance
+Args: DATABASE_URL read once at import
+Returns: an open psycopg2 connection, released back after each request
+'''
+
+import os
+import time
+import psycopg2
+from psycopg2 import extensions
+
+DATABASE_URL = os.environ.get('DATABASE_URL')
+
+# The server may drop connections that sit idle between invocations; reconnect
+# instead of failing the first query of a request after a long pause
+MAX_IDLE_SECONDS = 60
+
+_conn = None
+_released_at = 0.0
+
+
+def get_connection():
+    global _conn
+    if _conn is not None and time.monotonic() - _released_at > MAX_IDLE_SECONDS:
+        _discard()
+    if _conn is not None:
+        # A request that raised before releasing can leave a transaction open
+        _reset(_conn)
+    if _conn is None:
+        _conn = psycopg2.connect(DATABASE_URL)
+    return _conn
+
+
+def release_connection(conn) -> None:
+    '''End the request's transaction and keep the connection for the next invocation'''
+    global _released_at
+    _reset(conn)
+    _released_at = time.monotonic()
+
+
+def _reset(conn) -> None:
+    if conn.closed or conn.get_transaction_status() == extensions.TRANSACTION_STATUS_UNKNOWN:
+        if conn is _conn:
+            _discard()
+    elif conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+        conn.rollback()
+
+
+def _discard() -> None:
+    global _conn
+    try:
+        _conn.close()
+    except psycopg2.Error:
+        pass
+    _conn = None
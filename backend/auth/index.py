@@ -5,35 +5,37 @@ Returns: HTTP response with user data and auth token or error
 '''
 
 import json
-import os
 import re
 import hashlib
 from typing import Dict, Any
-import psycopg2
+
+from db import get_connection, release_connection
+from response import success_response, error_response, options_response
+
+NICK_PATTERN = re.compile(r'^[a-zA-Z0-9_]+$')
+
+# Statements of the request paths, shared with scripts/explain_check.py so the
+# plan check sees exactly what runs here
+NICK_TAKEN_SQL = "SELECT id FROM users WHERE nick = %s"
+
+REGISTER_SQL = """INSERT INTO users (nick, password, money, spins) VALUES (%s, %s, 0, 0)
+                  RETURNING id, nick, money, spins, wins, losses, is_admin"""
+
+# Balance and battle record are the users snapshot plus ledger entries not yet compacted into it
+LOGIN_SQL = """SELECT u.id, u.nick, u.money + COALESCE(SUM(l.money_delta), 0), u.spins + COALESCE(SUM(l.spins_delta), 0),
+                      u.wins + COALESCE(SUM(l.wins_delta), 0), u.losses + COALESCE(SUM(l.losses_delta), 0), u.is_admin
+               FROM users u LEFT JOIN economy_ledger l ON l.user_id = u.id AND l.applied_at IS NULL
+               WHERE u.nick = %s AND u.password = %s
+               GROUP BY u.id"""
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
     
     if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'POST, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id, X-Auth-Token',
-                'Access-Control-Max-Age': '86400'
-            },
-            'body': '',
-            'isBase64Encoded': False
-        }
+        return options_response('POST, OPTIONS', 'Content-Type, X-User-Id, X-Auth-Token')
     
     if method != 'POST':
-        return {
-            'statusCode': 405,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Method not allowed'}),
-            'isBase64Encoded': False
-        }
+        return error_response('Method not allowed', 405)
     
     body_data = json.loads(event.get('body', '{}'))
     action = body_data.get('action')
@@ -41,104 +43,61 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     password = body_data.get('password', '')
     
     if not nick or not password:
-        return {
-            'statusCode': 400,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Nick and password are required'}),
-            'isBase64Encoded': False
-        }
+        return error_response('Nick and password are required', 400)
     
-    if not re.match(r'^[a-zA-Z0-9_]+$', nick):
-        return {
-            'statusCode': 400,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Nick must contain only English letters, numbers, and underscores'}),
-            'isBase64Encoded': False
-        }
+    if not NICK_PATTERN.match(nick):
+        return error_response('Nick must contain only English letters, numbers, and underscores', 400)
     
     password_hash = hashlib.sha256(password.encode()).hexdigest()
-    database_url = os.environ.get('DATABASE_URL')
-    
-    conn = psycopg2.connect(database_url)
+    conn = get_connection()
     cur = conn.cursor()
     
     if action == 'register':
-        cur.execute("SELECT id FROM users WHERE nick = %s", (nick,))
+        cur.execute(NICK_TAKEN_SQL, (nick,))
         if cur.fetchone():
             cur.close()
-            conn.close()
-            return {
-                'statusCode': 400,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'Nick already exists'}),
-                'isBase64Encoded': False
-            }
+            release_connection(conn)
+            return error_response('Nick already exists', 400)
         
-        cur.execute(
-            "INSERT INTO users (nick, password, money, spins) VALUES (%s, %s, 0, 0) RETURNING id, nick, money, spins, wins, losses, is_admin",
-            (nick, password_hash)
-        )
+        cur.execute(REGISTER_SQL, (nick, password_hash))
         user = cur.fetchone()
         conn.commit()
         cur.close()
-        conn.close()
+        release_connection(conn)
         
-        return {
-            'statusCode': 200,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({
-                'success': True,
-                'user': {
-                    'id': user[0],
-                    'nick': user[1],
-                    'money': user[2],
-                    'spins': user[3],
-                    'wins': user[4],
-                    'losses': user[5],
-                    'is_admin': user[6]
-                }
-            }),
-            'isBase64Encoded': False
-        }
+        return success_response({
+            'success': True,
+            'user': {
+                'id': user[0],
+                'nick': user[1],
+                'money': user[2],
+                'spins': user[3],
+                'wins': user[4],
+                'losses': user[5],
+                'is_admin': user[6]
+            }
+        })
     
     elif action == 'login':
-        cur.execute(
-            "SELECT id, nick, money, spins, wins, losses, is_admin FROM users WHERE nick = %s AND password = %s",
-            (nick, password_hash)
-        )
+        cur.execute(LOGIN_SQL, (nick, password_hash))
         user = cur.fetchone()
         cur.close()
-        conn.close()
+        release_connection(conn)
         
         if not user:
-            return {
-                'statusCode': 401,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'Invalid credentials'}),
-                'isBase64Encoded': False
-            }
+            return error_response('Invalid credentials', 401)
         
-        return {
-            'statusCode': 200,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({
-                'success': True,
-                'user': {
-                    'id': user[0],
-                    'nick': user[1],
-                    'money': user[2],
-                    'spins': user[3],
-                    'wins': user[4],
-                    'losses': user[5],
-                    'is_admin': user[6]
-                }
-            }),
-            'isBase64Encoded': False
-        }
+        return success_response({
+            'success': True,
+            'user': {
+                'id': user[0],
+                'nick': user[1],
+                'money': user[2],
+                'spins': user[3],
+                'wins': user[4],
+                'losses': user[5],
+                'is_admin': user[6]
+            }
+        })
     
-    return {
-        'statusCode': 400,
-        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-        'body': json.dumps({'error': 'Invalid action'}),
-        'isBase64Encoded': False
-    }
\ No newline at end of file
+    return error_response('Invalid action', 400)
\ No newline at end of file
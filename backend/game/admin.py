@@ -0,0 +1,204 @@
+'''
+Business: Admin panel actions for the powers catalog, rarities and player resources
+Args: cursor/connection of the game handler, action name and request data
+Returns: HTTP response, or None when the action is not an admin action
+'''
+
+from typing import Dict, Any, Optional
+
+from battle_log import FIELD_MAX
+from response import success_response, error_response
+
+
+def handle_admin_get(cur, action: str, params: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    if action == 'admin_get_rarities':
+        return admin_get_rarities(cur)
+    if action == 'admin_get_powers':
+        return admin_get_powers(cur)
+    if action == 'admin_stats_daily':
+        return admin_stats_daily(cur, params)
+    if action == 'admin_power_stats':
+        return admin_power_stats(cur)
+    if action == 'admin_active_battles':
+        return admin_active_battles(cur)
+    return None
+
+
+def handle_admin_post(cur, conn, action: str, data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    if action == 'admin_create_power':
+        return admin_create_power(cur, conn, data)
+    if action == 'admin_delete_power':
+        return admin_delete_power(cur, conn, data)
+    if action == 'admin_create_rarity':
+        return admin_create_rarity(cur, conn, data)
+    if action == 'admin_delete_rarity':
+        return admin_delete_rarity(cur, conn, data)
+    if action == 'admin_give_spins':
+        return admin_give_resource(cur, conn, data, 'spins')
+    if action == 'admin_give_money':
+        return admin_give_resource(cur, conn, data, 'money')
+    if action == 'admin_recount_battle_stats':
+        return admin_recount_battle_stats(cur, conn)
+    return None
+
+
+def admin_get_rarities(cur) -> Dict[str, Any]:
+    cur.execute("SELECT id, name, drop_chance, color FROM rarities ORDER BY drop_chance DESC")
+    rarities = cur.fetchall()
+    rarities_list = []
+    for r in rarities:
+        rarity_dict = dict(r)
+        rarity_dict['drop_chance'] = float(rarity_dict['drop_chance'])
+        rarities_list.append(rarity_dict)
+    return success_response({'success': True, 'rarities': rarities_list})
+
+
+def admin_get_powers(cur) -> Dict[str, Any]:
+    cur.execute("""
+        SELECT p.id, p.name, p.rarity_id, r.name as rarity_name, r.color,
+               p.power_type, p.cooldown, p.damage, p.shield_duration
+        FROM powers_new p 
+        JOIN rarities r ON p.rarity_id = r.id 
+        ORDER BY p.id DESC
+    """)
+    powers = cur.fetchall()
+    return success_response({'success': True, 'powers': [dict(p) for p in powers]})
+
+
+# Analytics endpoints read only the rollup tables (stats_daily, power_stats)
+# kept up to date by the spin, equip and battle paths
+STATS_MAX_DAYS = 365
+
+
+def admin_stats_daily(cur, params: Dict[str, Any]) -> Dict[str, Any]:
+    try:
+        days = min(max(int(params.get('days') or 30), 1), STATS_MAX_DAYS)
+    except (TypeError, ValueError):
+        return error_response('days must be a number', 400)
+    
+    cur.execute("""
+        SELECT day, SUM(spins) AS spins, SUM(new_powers) AS new_powers,
+               SUM(battles_started) AS battles_started, SUM(battles_finished) AS battles_finished
+        FROM stats_daily
+        WHERE day > CURRENT_DATE - %s
+        GROUP BY day
+        ORDER BY day DESC
+    """, (days,))
+    rows = cur.fetchall()
+    return success_response({'success': True, 'days': [dict(r, day=r['day'].isoformat()) for r in rows]})
+
+
+def admin_power_stats(cur) -> Dict[str, Any]:
+    cur.execute("""
+        SELECT s.power_id, p.name, SUM(s.battles) AS battles, SUM(s.wins) AS wins, SUM(s.equips) AS equips
+        FROM power_stats s
+        JOIN powers_new p ON p.id = s.power_id
+        GROUP BY s.power_id, p.name
+        ORDER BY battles DESC, s.power_id
+    """)
+    powers = []
+    for row in cur.fetchall():
+        power = dict(row)
+        power['win_rate'] = row['wins'] / row['battles'] if row['battles'] else None
+        powers.append(power)
+    return success_response({'success': True, 'powers': powers})
+
+
+def admin_active_battles(cur) -> Dict[str, Any]:
+    # Every battle is counted once when started and once when finished
+    cur.execute("SELECT COALESCE(SUM(battles_started - battles_finished), 0) AS active FROM stats_daily")
+    return success_response({'success': True, 'active_battles': int(cur.fetchone()['active'])})
+
+
+def admin_recount_battle_stats(cur, conn) -> Dict[str, Any]:
+    '''Rebuild the battle counters of stats_daily from battles; a full scan meant for repairs, not dashboards'''
+    cur.execute("LOCK TABLE stats_daily IN SHARE ROW EXCLUSIVE MODE")
+    cur.execute("UPDATE stats_daily SET battles_started = 0, battles_finished = 0")
+    cur.execute("""
+        INSERT INTO stats_daily (day, shard, battles_started, battles_finished)
+        SELECT day, 0, SUM(started), SUM(finished) FROM (
+            SELECT created_at::date AS day, 1 AS started, 0 AS finished FROM battles
+            UNION ALL
+            SELECT COALESCE(finished_at, created_at)::date, 0, 1 FROM battles WHERE status != 'active'
+        ) counted
+        GROUP BY day
+        ON CONFLICT (day, shard) DO UPDATE SET battles_started = EXCLUDED.battles_started,
+                                               battles_finished = EXCLUDED.battles_finished
+    """)
+    days = cur.rowcount
+    conn.commit()
+    return success_response({'success': True, 'days': days})
+
+
+def admin_create_power(cur, conn, data: Dict[str, Any]) -> Dict[str, Any]:
+    name = data.get('name')
+    rarity_id = data.get('rarity_id')
+    power_type = data.get('power_type')
+    try:
+        cooldown = int(data.get('cooldown') or 0)
+        damage = int(data.get('damage') or 0)
+        shield_duration = int(data.get('shield_duration') or 0)
+    except (TypeError, ValueError):
+        return error_response('cooldown, damage and shield_duration must be numbers', 400)
+    
+    if not all(0 <= value <= FIELD_MAX for value in (cooldown, damage, shield_duration)):
+        return error_response(f'cooldown, damage and shield_duration must be between 0 and {FIELD_MAX}', 400)
+    
+    cur.execute(
+        """INSERT INTO powers_new (name, rarity_id, power_type, cooldown, damage, shield_duration) 
+           VALUES (%s, %s, %s, %s, %s, %s)""",
+        (name, rarity_id, power_type, cooldown, damage, shield_duration)
+    )
+    conn.commit()
+    return success_response({'success': True})
+
+
+def admin_delete_power(cur, conn, data: Dict[str, Any]) -> Dict[str, Any]:
+    power_id = data.get('power_id')
+    
+    cur.execute("DELETE FROM powers_new WHERE id = %s", (power_id,))
+    conn.commit()
+    return success_response({'success': True})
+
+
+def admin_create_rarity(cur, conn, data: Dict[str, Any]) -> Dict[str, Any]:
+    name = data.get('name')
+    drop_chance = data.get('drop_chance')
+    color = data.get('color')
+    
+    cur.execute(
+        "INSERT INTO rarities (name, drop_chance, color) VALUES (%s, %s, %s)",
+        (name, drop_chance, color)
+    )
+    conn.commit()
+    return success_response({'success': True})
+
+
+def admin_delete_rarity(cur, conn, data: Dict[str, Any]) -> Dict[str, Any]:
+    rarity_id = data.get('rarity_id')
+    
+    cur.execute("DELETE FROM rarities WHERE id = %s", (rarity_id,))
+    conn.commit()
+    return success_response({'success': True})
+
+
+def admin_give_resource(cur, conn, data: Dict[str, Any], resource: str) -> Dict[str, Any]:
+    target = data.get('target')
+    amount = data.get('amount')
+    
+    if target == 'all':
+        cur.execute(
+            f"INSERT INTO economy_ledger (user_id, {resource}_delta, reason) SELECT id, %s, 'admin_give' FROM users",
+            (amount,)
+        )
+    else:
+        nick = data.get('nick')
+        cur.execute(
+            f"INSERT INTO economy_ledger (user_id, {resource}_delta, reason) SELECT id, %s, 'admin_give' FROM users WHERE nick = %s",
+            (amount, nick)
+        )
+        if cur.rowcount == 0:
+            return error_response('User not found', 404)
+    
+    conn.commit()
+    return success_response({'success': True})
\ No newline at end of file
@@ -0,0 +1,215 @@
+'''
+Business: Offline balance simulator for the powers/rarities catalog (not used by the handler)
+Args: catalog JSON file or DATABASE_URL, number of battles, loadout size and click rate
+Returns: JSON report with win rate per power, time-to-kill distribution and expected spin value
+
+Usage: python balance_sim.py --catalog catalog.json --battles 1000000
+Requires numpy, which is intentionally not part of the function requirements.
+'''
+
+import argparse
+import json
+import os
+import sys
+from typing import Dict, Any, List
+
+import numpy as np
+
+from rules import START_HP, BASE_ATTACK_DAMAGE, COUNTER_WINDOW_MS
+
+POWER_TYPES = {'attack': 0, 'defense': 1, 'counter': 2}
+
+
+def load_catalog_from_db(database_url: str) -> List[Dict[str, Any]]:
+    import psycopg2
+    from psycopg2.extras import RealDictCursor
+
+    conn = psycopg2.connect(database_url)
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    try:
+        # Same row order as the spin query, which the cumulative drop roll depends on
+        cur.execute("""
+            SELECT p.id, p.name, r.name as rarity, r.drop_chance, p.power_type,
+                   p.cooldown, p.damage, p.shield_duration
+            FROM powers_new p
+            JOIN rarities r ON p.rarity_id = r.id
+        """)
+        return [dict(row, drop_chance=float(row['drop_chance'])) for row in cur.fetchall()]
+    finally:
+        cur.close()
+        conn.close()
+
+
+def spin_probabilities(catalog: List[Dict[str, Any]]) -> np.ndarray:
+    '''Exact per-power probabilities of the spin roll: uniform(0, 100) against cumulative drop chances, first power as fallback'''
+    cumulative = np.minimum(np.cumsum([float(p['drop_chance']) for p in catalog]), 100.0)
+    probs = np.diff(np.concatenate(([0.0], cumulative))) / 100.0
+    probs[0] += max(0.0, 100.0 - cumulative[-1]) / 100.0
+    return probs
+
+
+def simulate(catalog: List[Dict[str, Any]], battles: int, slots: int = 3, clicks_per_second: float = 5.0,
+             tick_ms: int = 100, max_seconds: int = 120, rng: np.random.Generator = None) -> Dict[str, np.ndarray]:
+    '''Run a batch of battles between random loadouts drawn by spins; every array is indexed by battle'''
+    rng = rng or np.random.default_rng()
+    n = battles
+
+    kind = np.array([POWER_TYPES.get(p['power_type'], -1) for p in catalog])
+    damage = np.array([p['damage'] or 0 for p in catalog], dtype=np.int64)
+    cooldown_ms = np.array([(p['cooldown'] or 0) * 1000 for p in catalog], dtype=np.int64)
+    shield_ms = np.array([(p['shield_duration'] or 0) * 1000 for p in catalog], dtype=np.int64)
+
+    loadout = rng.choice(len(catalog), size=(n, 2, slots), p=spin_probabilities(catalog))
+    # Inventory is unique per power, so a repeated draw leaves that slot empty
+    equipped = np.ones((n, 2, slots), dtype=bool)
+    for s in range(1, slots):
+        equipped[:, :, s] = ~(loadout[:, :, s:s + 1] == loadout[:, :, :s]).any(axis=2)
+
+    hp = np.full((n, 2), START_HP, dtype=np.int64)
+    shield_until = np.zeros((n, 2), dtype=np.int64)
+    counter_until = np.zeros((n, 2), dtype=np.int64)
+    counter_damage = np.zeros((n, 2), dtype=np.int64)
+    can_use_at = np.zeros((n, 2, slots), dtype=np.int64)
+    winner = np.full(n, -1, dtype=np.int64)
+    finished_at = np.zeros(n, dtype=np.int64)
+    click_chance = clicks_per_second * tick_ms / 1000.0
+
+    def attack(rows, mask, actor, foe, dmg, now):
+        blocked = now < shield_until[rows, foe]
+        countered = mask & ~blocked & (now < counter_until[rows, foe])
+        hit = mask & ~blocked & ~countered
+        hp[rows, actor] -= np.where(countered, counter_damage[rows, foe], 0)
+        counter_until[rows, foe] = np.where(countered, 0, counter_until[rows, foe])
+        hp[rows, foe] -= np.where(hit, dmg, 0)
+
+    def settle(rows, now):
+        active = winner[rows] < 0
+        p1_down = active & (hp[rows, 0] <= 0)
+        p2_down = active & ~p1_down & (hp[rows, 1] <= 0)
+        winner[rows[p1_down]] = 1
+        winner[rows[p2_down]] = 0
+        finished_at[rows[p1_down | p2_down]] = now
+
+    def act(rows, actor, now):
+        foe = 1 - actor
+        for s in range(slots):
+            power = loadout[rows, actor, s]
+            ready = (winner[rows] < 0) & equipped[rows, actor, s] & (now >= can_use_at[rows, actor, s])
+            power_kind = kind[power]
+
+            attack(rows, ready & (power_kind == 0), actor, foe, damage[power], now)
+
+            shielding = ready & (power_kind == 1)
+            shield_until[rows, actor] = np.where(shielding, now + shield_ms[power], shield_until[rows, actor])
+
+            countering = ready & (power_kind == 2)
+            counter_until[rows, actor] = np.where(countering, now + COUNTER_WINDOW_MS, counter_until[rows, actor])
+            counter_damage[rows, actor] = np.where(countering, damage[power], counter_damage[rows, actor])
+
+            used = ready & (power_kind >= 0)
+            can_use_at[rows, actor, s] = np.where(used, now + cooldown_ms[power], can_use_at[rows, actor, s])
+            settle(rows, now)
+
+        clicking = (winner[rows] < 0) & (rng.random(len(rows)) < click_chance)
+        attack(rows, clicking, actor, foe, BASE_ATTACK_DAMAGE, now)
+        settle(rows, now)
+
+    for now in range(0, max_seconds * 1000, tick_ms):
+        # Only battles still running take part in the tick
+        rows = np.flatnonzero(winner < 0)
+        if not rows.size:
+            break
+        # Random order inside a tick so neither slot gets a first-mover advantage
+        first = rng.integers(0, 2, size=rows.size)
+        act(rows, first, now)
+        act(rows, 1 - first, now)
+
+    return {'loadout': loadout, 'equipped': equipped, 'winner': winner, 'finished_at': finished_at}
+
+
+def build_report(catalog: List[Dict[str, Any]], results: List[Dict[str, np.ndarray]]) -> Dict[str, Any]:
+    count = len(catalog)
+    played = np.zeros(count)
+    won = np.zeros(count)
+    ttk = []
+    total = 0
+    draws = 0
+
+    for batch in results:
+        winner = batch['winner']
+        total += len(winner)
+        draws += int((winner < 0).sum())
+        ttk.append(batch['finished_at'][winner >= 0] / 1000.0)
+
+        side_won = np.stack([winner == 0, winner == 1], axis=1)[:, :, None]
+        side_won = np.broadcast_to(side_won, batch['loadout'].shape)
+        mask = batch['equipped']
+        played += np.bincount(batch['loadout'][mask], minlength=count)
+        won += np.bincount(batch['loadout'][mask & side_won], minlength=count)
+
+    win_rate = np.divide(won, played, out=np.full(count, np.nan), where=played > 0)
+    probs = spin_probabilities(catalog)
+    ttk = np.concatenate(ttk) if ttk else np.array([])
+    known = ~np.isnan(win_rate)
+
+    return {
+        'battles': total,
+        'draws': draws,
+        'drop_chance_total': float(sum(float(p['drop_chance']) for p in catalog)),
+        'time_to_kill_s': {
+            'mean': float(ttk.mean()) if ttk.size else None,
+            'p10': float(np.percentile(ttk, 10)) if ttk.size else None,
+            'p50': float(np.percentile(ttk, 50)) if ttk.size else None,
+            'p90': float(np.percentile(ttk, 90)) if ttk.size else None
+        },
+        'expected_spin_win_rate': float((probs[known] * win_rate[known]).sum() / probs[known].sum()) if known.any() else None,
+        'powers': [
+            {
+                'id': p['id'],
+                'name': p['name'],
+                'rarity': p.get('rarity'),
+                'spin_probability': float(probs[i]),
+                'battles': int(played[i]),
+                'win_rate': None if np.isnan(win_rate[i]) else float(win_rate[i])
+            }
+            for i, p in enumerate(catalog)
+        ]
+    }
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description='Simulate battles between random loadouts of the current catalog')
+    parser.add_argument('--catalog', help='JSON list of powers; defaults to reading DATABASE_URL')
+    parser.add_argument('--battles', type=int, default=1000000)
+    parser.add_argument('--batch', type=int, default=200000)
+    parser.add_argument('--slots', type=int, default=3)
+    parser.add_argument('--cps', type=float, default=5.0, help='basic attack clicks per second')
+    parser.add_argument('--tick-ms', type=int, default=100)
+    parser.add_argument('--max-seconds', type=int, default=120)
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args(argv)
+
+    if args.catalog:
+        with open(args.catalog) as f:
+            catalog = json.load(f)
+    else:
+        catalog = load_catalog_from_db(os.environ['DATABASE_URL'])
+
+    if not catalog:
+        print('Catalog is empty', file=sys.stderr)
+        return 1
+
+    rng = np.random.default_rng(args.seed)
+    results = []
+    remaining = args.battles
+    while remaining > 0:
+        size = min(args.batch, remaining)
+        results.append(simulate(catalog, size, args.slots, args.cps, args.tick_ms, args.max_seconds, rng))
+        remaining -= size
+
+    print(json.dumps(build_report(catalog, results), indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
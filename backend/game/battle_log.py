@@ -0,0 +1,103 @@
+'''
+Business: Append-only battle action log encoding and deterministic replay
+Args: packed action records as stored in battles.action_log
+Returns: encoded records, decoded actions, or the re-simulated battle outcome
+'''
+
+import struct
+from typing import Dict, Any, Iterable, Iterator, List, Tuple
+
+from rules import (new_battle_state, resolve_attack, activate_shield, activate_counter,
+                   winner_slot, START_HP)
+
+# ts_ms, player slot, action kind, power_id (0 for the basic attack), amount, cooldown seconds
+RECORD = struct.Struct('<QBBIHH')
+# amount and cooldown are unsigned 16-bit; power stats outside this range cannot be logged
+FIELD_MAX = 0xFFFF
+
+ACTION_ATTACK = 0
+ACTION_POWER_ATTACK = 1
+ACTION_SHIELD = 2
+ACTION_COUNTER = 3
+
+
+def encode_action(ts_ms: int, player: int, kind: int, power_id: int = 0, amount: int = 0, cooldown: int = 0) -> bytes:
+    '''amount is the damage for attacks and counters, the shield duration in seconds for shields'''
+    return RECORD.pack(ts_ms, player, kind, power_id or 0, amount or 0, cooldown or 0)
+
+
+def decode_log(log: bytes) -> Iterator[Tuple[int, int, int, int, int, int]]:
+    return RECORD.iter_unpack(bytes(log))
+
+
+def resolve_actions(records: List[Tuple[int, int, int, int, int, int]],
+                    start_hp: int = START_HP) -> Tuple[Dict[str, Any], List[Tuple[str, int]]]:
+    '''Apply decoded records in timestamp order (log order for equal timestamps) with the live rules;
+    returns the final state and (outcome, hp lost) per record, in the order of the input'''
+    state = new_battle_state(start_hp)
+    can_use_at: Dict[Tuple[int, int], int] = {}
+    outcomes: List[Tuple[str, int]] = [('rejected', 0)] * len(records)
+    winner = None
+    
+    for index in sorted(range(len(records)), key=lambda i: records[i][0]):
+        ts_ms, player, kind, power_id, amount, cooldown = records[index]
+        if winner is not None:
+            continue
+        
+        if power_id:
+            key = (player, power_id)
+            if ts_ms < can_use_at.get(key, 0):
+                continue
+            can_use_at[key] = ts_ms + cooldown * 1000
+        
+        if kind == ACTION_ATTACK or kind == ACTION_POWER_ATTACK:
+            outcomes[index] = resolve_attack(state, player, amount, ts_ms)
+        elif kind == ACTION_SHIELD:
+            activate_shield(state, player, amount, ts_ms)
+            outcomes[index] = ('shield', 0)
+        elif kind == ACTION_COUNTER:
+            activate_counter(state, player, amount, ts_ms)
+            outcomes[index] = ('counter', 0)
+        else:
+            continue
+        
+        winner = winner_slot(state)
+    
+    return state, outcomes
+
+
+def replay(log: bytes, start_hp: int = START_HP) -> Dict[str, Any]:
+    '''Re-simulate a battle from its log with the same shield/counter/cooldown rules as the live handlers'''
+    state, outcomes = resolve_actions(list(decode_log(log)), start_hp)
+    rejected = sum(1 for outcome, _ in outcomes if outcome == 'rejected')
+    winner = winner_slot(state)
+    
+    return {
+        'player1_hp': state['player1_hp'],
+        'player2_hp': state['player2_hp'],
+        'winner_slot': winner,
+        'finished': winner is not None,
+        'actions': len(outcomes) - rejected,
+        'rejected': rejected
+    }
+
+
+def resolve_batch(log: bytes, attacker: int, clicks: List[int], damage: int,
+                  start_hp: int = START_HP) -> Tuple[Dict[str, Any], List[Tuple[str, int]], bytes]:
+    '''Merge buffered basic attacks into the logged actions by timestamp and re-simulate, so each click
+    only meets the shields and counters already active at its own time; returns the state, the outcome
+    per click and the records of the applied clicks.
+    Click times come from the client, so none is placed before the opponent's latest logged action:
+    a click cannot slip under a shield or counter the server already accepted'''
+    logged = list(decode_log(log))
+    floor = max((record[0] for record in logged if record[1] != attacker), default=0)
+    clicked = [(max(ts_ms, floor), attacker, ACTION_ATTACK, 0, damage, 0) for ts_ms in sorted(clicks)]
+    state, outcomes = resolve_actions(logged + clicked, start_hp)
+    outcomes = outcomes[len(logged):]
+    records = b''.join(RECORD.pack(*record) for record, (outcome, _) in zip(clicked, outcomes) if outcome != 'rejected')
+    return state, outcomes, records
+
+
+def replay_many(logs: Iterable[bytes], start_hp: int = START_HP) -> Iterator[Dict[str, Any]]:
+    for log in logs:
+        yield replay(log, start_hp)
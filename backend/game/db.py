@@ -0,0 +1,85 @@
+'''
+Business: Database connections reused across invocations of a warm function instance
+Args: DATABASE_URL and optional DATABASE_READ_URL (read replica) read once at import
+Returns: an open psycopg2 connection to the primary or the replica, released back after each request
+
+Read-only actions go to the replica when DATABASE_READ_URL is set. Every write
+response carries a primary-until time (X-Primary-Until, ms since the epoch,
+PRIMARY_PIN_SECONDS ahead) that the client echoes on its requests; until then
+its reads stay on the primary, whichever function or instance serves them.
+Pointing the two variables at two local Postgres instances is enough to
+exercise the routing.
+'''
+
+import os
+import time
+from typing import Any, Dict, Optional
+import psycopg2
+from psycopg2 import extensions
+
+DATABASE_URL = os.environ.get('DATABASE_URL')
+DATABASE_READ_URL = os.environ.get('DATABASE_READ_URL')
+
+# The server may drop connections that sit idle between invocations; reconnect
+# instead of failing the first query of a request after a long pause
+MAX_IDLE_SECONDS = 60
+PRIMARY_PIN_SECONDS = 10
+
+_urls = {'primary': DATABASE_URL, 'replica': DATABASE_READ_URL}
+_conns: Dict[str, Any] = {}
+_released_at: Dict[str, float] = {}
+
+
+def get_connection(read_only: bool = False, pinned_until: Optional[str] = None):
+    '''Replica connection for read-only work of clients past their primary-until time, primary otherwise'''
+    role = 'replica' if read_only and DATABASE_READ_URL and not is_pinned(pinned_until) else 'primary'
+    conn = _conns.get(role)
+    if conn is not None and time.monotonic() - _released_at.get(role, 0.0) > MAX_IDLE_SECONDS:
+        _discard(role)
+    elif conn is not None:
+        # A request that raised before releasing can leave a transaction open
+        _reset(conn)
+    if role not in _conns:
+        _conns[role] = psycopg2.connect(_urls[role])
+    return _conns[role]
+
+
+def release_connection(conn) -> None:
+    '''End the request's transaction and keep the connection for the next invocation'''
+    _reset(conn)
+    for role, known in _conns.items():
+        if known is conn:
+            _released_at[role] = time.monotonic()
+
+
+def primary_until() -> Optional[str]:
+    '''Value for the X-Primary-Until header of a write response, None without a replica'''
+    if not DATABASE_READ_URL:
+        return None
+    return str(int((time.time() + PRIMARY_PIN_SECONDS) * 1000))
+
+
+def is_pinned(pinned_until: Optional[str]) -> bool:
+    '''pinned_until is the X-Primary-Until value the client echoed, if any'''
+    try:
+        return pinned_until is not None and int(pinned_until) > time.time() * 1000
+    except ValueError:
+        return False
+
+
+def _reset(conn) -> None:
+    if conn.closed or conn.get_transaction_status() == extensions.TRANSACTION_STATUS_UNKNOWN:
+        for role, known in list(_conns.items()):
+            if known is conn:
+                _discard(role)
+    elif conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+        conn.rollback()
+
+
+def _discard(role: str) -> None:
+    conn = _conns.pop(role, None)
+    try:
+        if conn is not None:
+            conn.close()
+    except psycopg2.Error:
+        pass
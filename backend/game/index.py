@@ -5,44 +5,315 @@ Returns: HTTP response with game state, battle result, or admin operations
 '''
 
 import json
-import os
-import random
 import time
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional
 import psycopg2
 from psycopg2.extras import RealDictCursor
 
+from rules import resolve_attack, activate_shield, activate_counter, BASE_ATTACK_DAMAGE, COUNTER_WINDOW_MS
+from battle_log import encode_action, replay, resolve_batch, ACTION_ATTACK, ACTION_POWER_ATTACK, ACTION_SHIELD, ACTION_COUNTER
+from db import get_connection, release_connection, primary_until
+from scheduler import BattleTimers
+from throttle import ActionThrottle
+from response import success_response, error_response, options_response, get_header, with_header, finalize_response
+
+# A battle with no action for this long is finished: the player who acted last
+# wins, a battle nobody acted in ends without a winner. Deadlines live in
+# battles.button_expires_at; each instance also keeps a timer heap of the
+# battles it served and finishes the due ones in one bulk update per request.
+# Battles whose instance was recycled are caught by a sweep over all of them,
+# at most once per interval per instance (or by the expire_battles action).
+# The interval counts from import, so a cold start does not pay for a sweep.
+BATTLE_IDLE_TIMEOUT_SECONDS = 60
+EXPIRE_BATCH_SIZE = 100
+EXPIRE_SWEEP_INTERVAL_SECONDS = 30
+_last_expiry_sweep = time.time()
+
+# Money and spins credits and battle results (wins/losses) go to economy_ledger
+# instead of the hot users row, so ending a battle never updates users;
+# balances are the users snapshot plus pending entries, which are folded into
+# users in batches (at most once per interval per instance, counted from
+# import like the expiry sweep, or by the compact_ledger action) and for a
+# single user right before they spend.
+WIN_MONEY_REWARD = 100
+WIN_SPINS_REWARD = 1
+CANCEL_SEARCH_REWARD = 10
+LEDGER_COMPACT_INTERVAL_SECONDS = 30
+LEDGER_COMPACT_BATCH_SIZE = 500
+_last_ledger_compaction = time.time()
+
+# Expiry and compaction run inside user requests; they give up on locks held
+# longer than this instead of delaying the request they piggyback on
+HOUSEKEEPING_LOCK_TIMEOUT_MS = 1000
+
+# Power definitions change only through admin actions; warm instances reuse
+# the whole (small) powers_new table for a short while
+POWERS_TTL_SECONDS = 30
+_powers_cache: Dict[str, Any] = {'expires_at': 0.0, 'powers': {}}
+
+# attack_batch accepts clicks buffered by the client for at most this long
+ATTACK_BATCH_WINDOW_MS = 2000
+ATTACK_BATCH_MAX_CLICKS = 10
+_battle_timers = BattleTimers()
+ACTIVITY_COLUMNS = "current_turn = %s, button_expires_at = NOW() + %s * INTERVAL '1 second'"
+
+# GET actions that may read from the replica (DATABASE_READ_URL) unless the
+# client sends a primary-until time from a recent write (see db.py). Battle and
+# matchmaking reads stay on the primary.
+REPLICA_GET_ACTIONS = {
+    'get_user_powers', 'get_user_slots', 'admin_get_powers', 'admin_get_rarities',
+    'admin_stats_daily', 'admin_power_stats', 'admin_active_battles'
+}
+
+# Rollup counters are spread over STATS_SHARDS rows per key, picked at random,
+# so battle ends, spins and matchmaking do not all wait on one row lock
+STATS_SHARDS = 16
+STATS_SHARD = f"floor(random() * {STATS_SHARDS})::smallint"
+
+# Rollups read by the admin analytics endpoints, updated by every statement that
+# ends battles; its `finished` CTE returns (id, player1_id, player2_id, winner_id).
+# Power rows are written in power_id order so concurrent battle ends cannot deadlock
+FINISHED_BATTLE_ROLLUPS = f"""daily_finished AS (
+               INSERT INTO stats_daily (day, shard, battles_finished)
+               SELECT CURRENT_DATE, {STATS_SHARD}, COUNT(*) FROM finished HAVING COUNT(*) > 0
+               ON CONFLICT (day, shard) DO UPDATE SET battles_finished = stats_daily.battles_finished + EXCLUDED.battles_finished
+           ), power_results AS (
+               INSERT INTO power_stats (power_id, shard, battles, wins)
+               SELECT up.power_id, {STATS_SHARD}, COUNT(*), COUNT(*) FILTER (WHERE up.user_id = f.winner_id)
+               FROM finished f
+               JOIN user_powers up ON up.user_id IN (f.player1_id, f.player2_id) AND up.equipped_slot IS NOT NULL
+               GROUP BY up.power_id
+               ORDER BY up.power_id
+               ON CONFLICT (power_id, shard) DO UPDATE SET battles = power_stats.battles + EXCLUDED.battles,
+                                                           wins = power_stats.wins + EXCLUDED.wins
+           )"""
+
+# Requests per second and burst per user; over-limit and duplicate requests
+# (same idempotency key) are answered before a database connection is opened.
+# attack_batch takes one token per click from the attack bucket
+_throttle = ActionThrottle({
+    'attack': (10.0, 15.0),
+    'use_power': (5.0, 5.0),
+    'buy_slot': (1.0, 3.0)
+}, shared={'attack_batch': 'attack'})
+
+# Statements of the request paths, shared with scripts/explain_check.py so the
+# plan check sees exactly what runs here; {slot_column} is filled in per request
+# check_match is polled every few seconds during a search; the partial indexes of
+# V0007 keep it to two index probes over active battles only
+CHECK_MATCH_SQL = """SELECT id, player1_id, player2_id, player1_hp, player2_hp
+                   FROM battles WHERE (player1_id = %s OR player2_id = %s) AND status = 'active'"""
+
+BATTLE_STATE_SQL = """SELECT player1_id, player2_id, player1_hp, player2_hp, player1_shield_until,
+                      player2_shield_until, player1_counter_until, player2_counter_until,
+                      player1_counter_damage, player2_counter_damage, status, winner_id
+                      FROM battles WHERE id = %s"""
+
+BATTLE_REPLAY_SQL = "SELECT player1_id, player2_id, player1_hp, player2_hp, status, winner_id, action_log FROM battles WHERE id = %s"
+
+USER_POWERS_SQL = """SELECT p.id, p.name, p.power_type, p.cooldown, p.damage, p.shield_duration, up.equipped_slot
+                     FROM user_powers up
+                     JOIN powers_new p ON up.power_id = p.id
+                     WHERE up.user_id = %s AND up.equipped_slot IS NOT NULL
+                     ORDER BY up.equipped_slot"""
+
+USER_SLOTS_SQL = "SELECT slot2_unlocked, slot3_unlocked FROM users WHERE id = %s"
+
+QUEUE_EXPIRE_SQL = "DELETE FROM matchmaking_queue WHERE joined_at < NOW() - INTERVAL '25 seconds'"
+QUEUE_OPPONENT_SQL = "SELECT user_id FROM matchmaking_queue WHERE user_id != %s ORDER BY joined_at LIMIT 1"
+QUEUE_JOIN_SQL = "INSERT INTO matchmaking_queue (user_id) VALUES (%s) ON CONFLICT DO NOTHING"
+QUEUE_LEAVE_SQL = "DELETE FROM matchmaking_queue WHERE user_id IN (%s, %s)"
+
+START_BATTLE_SQL = f"""WITH battle AS (
+                          INSERT INTO battles (player1_id, player2_id, player1_hp, player2_hp, status, button_expires_at)
+                          VALUES (%s, %s, 100, 100, 'active', NOW() + %s * INTERVAL '1 second') RETURNING id
+                      ), daily_started AS (
+                          INSERT INTO stats_daily (day, shard, battles_started) VALUES (CURRENT_DATE, {STATS_SHARD}, 1)
+                          ON CONFLICT (day, shard) DO UPDATE SET battles_started = stats_daily.battles_started + 1
+                      )
+                      SELECT id FROM battle"""
+
+CANCEL_SEARCH_REWARD_SQL = """INSERT INTO economy_ledger (user_id, money_delta, reason)
+                              SELECT id, %s, 'cancel_search' FROM users WHERE id = %s"""
+
+BUY_SLOT_USER_SQL = "SELECT money, {slot_column} FROM users WHERE id = %s"
+
+BUY_SLOT_DEBIT_SQL = """WITH debit AS (
+                           UPDATE users SET money = money - %s, {slot_column} = TRUE
+                           WHERE id = %s AND money >= %s AND NOT {slot_column} RETURNING id, money
+                       ), audit AS (
+                           INSERT INTO economy_ledger (user_id, money_delta, reason, applied_at)
+                           SELECT id, -%s, 'buy_slot', NOW() FROM debit
+                       )
+                       SELECT money FROM debit"""
+
+ATTACK_BATTLE_SQL = """SELECT player1_id, player2_id, player1_hp, player2_hp, player1_shield_until,
+                       player2_shield_until, player1_counter_until, player2_counter_until,
+                       player1_counter_damage, player2_counter_damage, status
+                       FROM battles WHERE id = %s FOR UPDATE"""
+
+ATTACK_BATCH_BATTLE_SQL = """SELECT player1_id, player2_id, player1_hp, player2_hp, status, action_log
+                             FROM battles WHERE id = %s FOR UPDATE"""
+
+POWER_USE_BATTLE_SQL = "SELECT player1_id, player2_id, status FROM battles WHERE id = %s FOR UPDATE"
+
+POWER_COOLDOWN_SQL = "SELECT can_use_at FROM battle_cooldowns WHERE battle_id = %s AND user_id = %s AND power_id = %s"
+
+SET_POWER_COOLDOWN_SQL = """INSERT INTO battle_cooldowns (battle_id, user_id, power_id, can_use_at)
+                            VALUES (%s, %s, %s, %s)
+                            ON CONFLICT (battle_id, user_id, power_id)
+                            DO UPDATE SET can_use_at = %s"""
+
+POWERS_SQL = "SELECT * FROM powers_new"
+
+BATTLE_RESULT_SQL = """INSERT INTO economy_ledger (user_id, money_delta, spins_delta, wins_delta, losses_delta, reason)
+                       VALUES (%s, %s, %s, 1, 0, 'battle_win'), (%s, 0, 0, 0, 1, 'battle_loss')"""
+
+FINISH_BATTLE_SQL = f"""WITH finished AS (
+                           UPDATE battles SET status = 'finished', winner_id = %s, finished_at = NOW()
+                           WHERE id = %s RETURNING id, player1_id, player2_id, winner_id
+                       ), {FINISHED_BATTLE_ROLLUPS}
+                       SELECT id FROM finished"""
+
+BALANCE_SQL = """SELECT u.money + COALESCE(SUM(l.money_delta), 0) AS money, u.spins + COALESCE(SUM(l.spins_delta), 0) AS spins
+                 FROM users u LEFT JOIN economy_ledger l ON l.user_id = u.id AND l.applied_at IS NULL
+                 WHERE u.id = %s GROUP BY u.id"""
+
+APPLY_PENDING_LEDGER_SQL = """WITH pending AS (
+                                 UPDATE economy_ledger SET applied_at = NOW()
+                                 WHERE user_id = %s AND applied_at IS NULL
+                                 RETURNING money_delta, spins_delta, wins_delta, losses_delta
+                             )
+                             UPDATE users SET money = money + (SELECT COALESCE(SUM(money_delta), 0) FROM pending),
+                                              spins = spins + (SELECT COALESCE(SUM(spins_delta), 0) FROM pending),
+                                              wins = wins + (SELECT COALESCE(SUM(wins_delta), 0) FROM pending),
+                                              losses = losses + (SELECT COALESCE(SUM(losses_delta), 0) FROM pending)
+                             WHERE id = %s AND EXISTS (SELECT 1 FROM pending)"""
+
+LEDGER_CLAIM_SQL = """SELECT id, user_id FROM economy_ledger WHERE applied_at IS NULL
+                      ORDER BY id LIMIT %s FOR UPDATE SKIP LOCKED"""
+
+LEDGER_LOCK_USERS_SQL = "SELECT id FROM users WHERE id = ANY(%s) ORDER BY id FOR UPDATE"
+
+LEDGER_APPLY_SQL = """WITH applied AS (
+                         UPDATE economy_ledger SET applied_at = NOW() WHERE id = ANY(%s)
+                         RETURNING user_id, money_delta, spins_delta, wins_delta, losses_delta
+                     ), totals AS (
+                         SELECT user_id, SUM(money_delta) AS money, SUM(spins_delta) AS spins,
+                                SUM(wins_delta) AS wins, SUM(losses_delta) AS losses
+                         FROM applied GROUP BY user_id
+                     )
+                     UPDATE users u SET money = u.money + t.money, spins = u.spins + t.spins,
+                                        wins = u.wins + t.wins, losses = u.losses + t.losses
+                     FROM totals t WHERE u.id = t.user_id"""
+
+EXPIRE_BATTLES_SQL = f"""WITH expired AS (
+                            SELECT id FROM battles
+                            WHERE status = 'active'
+                              AND COALESCE(button_expires_at, created_at + %s * INTERVAL '1 second') < NOW()
+                              AND (%s::int[] IS NULL OR id = ANY(%s::int[]))
+                            ORDER BY button_expires_at
+                            LIMIT %s
+                            FOR UPDATE SKIP LOCKED
+                        ), finished AS (
+                            UPDATE battles b SET status = 'finished', finished_at = NOW(),
+                                winner_id = CASE WHEN length(b.action_log) = 0 THEN NULL
+                                                 WHEN b.current_turn = 2 THEN b.player2_id
+                                                 ELSE b.player1_id END
+                            FROM expired WHERE b.id = expired.id
+                            RETURNING b.id, b.player1_id, b.player2_id, b.winner_id
+                        ), results AS (
+                            SELECT winner_id AS user_id, 1 AS won, 0 AS lost FROM finished WHERE winner_id IS NOT NULL
+                            UNION ALL
+                            SELECT CASE WHEN winner_id = player1_id THEN player2_id ELSE player1_id END, 0, 1
+                            FROM finished WHERE winner_id IS NOT NULL
+                        ), totals AS (
+                            SELECT user_id, SUM(won) AS won, SUM(lost) AS lost FROM results GROUP BY user_id
+                        ), recorded AS (
+                            INSERT INTO economy_ledger (user_id, money_delta, spins_delta, wins_delta, losses_delta, reason)
+                            SELECT user_id, %s * won, %s * won, won, lost,
+                                   CASE WHEN won > 0 THEN 'battle_win' ELSE 'battle_loss' END
+                            FROM totals
+                        ), {FINISHED_BATTLE_ROLLUPS}
+                        SELECT id FROM finished"""
+
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
     
     if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id',
-                'Access-Control-Max-Age': '86400'
-            },
-            'body': '',
-            'isBase64Encoded': False
-        }
-    
-    database_url = os.environ.get('DATABASE_URL')
-    conn = psycopg2.connect(database_url)
+        return options_response('GET, POST, OPTIONS', 'Content-Type, X-User-Id, X-Idempotency-Key, X-Primary-Until')
+    
+    body_data: Dict[str, Any] = {}
+    if method == 'GET':
+        if (event.get('queryStringParameters') or {}).get('action') == 'throttle_stats':
+            return success_response({'success': True, **_throttle.stats()})
+    elif method == 'POST':
+        try:
+            body_data = json.loads(event.get('body') or '{}')
+        except ValueError:
+            return error_response('Invalid JSON body', 400)
+    
+    action = body_data.get('action')
+    user_id = body_data.get('user_id')
+    idempotency_key = body_data.get('idempotency_key') or get_header(event, 'X-Idempotency-Key')
+    
+    clicks = body_data.get('clicks') if action == 'attack_batch' else None
+    cost = min(max(len(clicks), 1), ATTACK_BATCH_MAX_CLICKS) if isinstance(clicks, list) else 1
+    verdict, cached = _throttle.check(user_id, action, idempotency_key, cost)
+    if verdict == 'duplicate':
+        return finalize_response(event, cached)
+    if verdict == 'limited':
+        return error_response('Too many requests', 429)
+    
+    response = handle_request(event, method, body_data)
+    _throttle.remember(user_id, action, idempotency_key, response)
+    if method == 'POST' and response['statusCode'] < 400:
+        response = with_header(response, 'X-Primary-Until', primary_until())
+    return finalize_response(event, response)
+
+
+def run_housekeeping(cur, conn) -> None:
+    '''Expire idle battles and fold pending ledger entries; a failing step is rolled back and left to a later request'''
+    global _last_expiry_sweep, _last_ledger_compaction
+    steps = []
+    
+    due = _battle_timers.pop_due(int(time.time() * 1000), EXPIRE_BATCH_SIZE)
+    if due:
+        steps.append(lambda: finish_idle_battles(cur, conn, due))
+    
+    if time.time() - _last_expiry_sweep > EXPIRE_SWEEP_INTERVAL_SECONDS:
+        _last_expiry_sweep = time.time()
+        steps.append(lambda: finish_idle_battles(cur, conn, None, EXPIRE_BATCH_SIZE))
+    
+    if time.time() - _last_ledger_compaction > LEDGER_COMPACT_INTERVAL_SECONDS:
+        _last_ledger_compaction = time.time()
+        steps.append(lambda: compact_ledger(cur, conn, LEDGER_COMPACT_BATCH_SIZE))
+    
+    for step in steps:
+        try:
+            cur.execute("SET LOCAL lock_timeout = %s", (HOUSEKEEPING_LOCK_TIMEOUT_MS,))
+            step()
+        except psycopg2.Error:
+            conn.rollback()
+
+
+def handle_request(event: Dict[str, Any], method: str, body_data: Dict[str, Any]) -> Dict[str, Any]:
+    params = event.get('queryStringParameters') or {}
+    read_only = method == 'GET' and params.get('action') in REPLICA_GET_ACTIONS
+    conn = get_connection(read_only, get_header(event, 'X-Primary-Until'))
     cur = conn.cursor(cursor_factory=RealDictCursor)
     
     try:
+        # Housekeeping writes, so it only runs on requests served by the primary
+        if not read_only:
+            run_housekeeping(cur, conn)
+        
         if method == 'GET':
-            params = event.get('queryStringParameters') or {}
             action = params.get('action')
             
             if action == 'check_match':
                 user_id = params.get('user_id')
-                cur.execute(
-                    "SELECT id, player1_id, player2_id, player1_hp, player2_hp FROM battles WHERE (player1_id = %s OR player2_id = %s) AND status = 'active'",
-                    (user_id, user_id)
-                )
+                cur.execute(CHECK_MATCH_SQL, (user_id, user_id))
                 battle = cur.fetchone()
                 
                 if battle:
@@ -58,13 +329,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             
             elif action == 'battle_state':
                 battle_id = params.get('battle_id')
-                cur.execute(
-                    """SELECT player1_id, player2_id, player1_hp, player2_hp, player1_shield_until, 
-                       player2_shield_until, player1_counter_until, player2_counter_until, 
-                       player1_counter_damage, player2_counter_damage, status, winner_id 
-                       FROM battles WHERE id = %s""",
-                    (battle_id,)
-                )
+                cur.execute(BATTLE_STATE_SQL, (battle_id,))
                 battle = cur.fetchone()
                 
                 if not battle:
@@ -72,42 +337,43 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 
                 return success_response(dict(battle))
             
-            elif action == 'admin_get_rarities':
-                cur.execute("SELECT id, name, drop_chance, color FROM rarities ORDER BY drop_chance DESC")
-                rarities = cur.fetchall()
-                rarities_list = []
-                for r in rarities:
-                    rarity_dict = dict(r)
-                    rarity_dict['drop_chance'] = float(rarity_dict['drop_chance'])
-                    rarities_list.append(rarity_dict)
-                return success_response({'success': True, 'rarities': rarities_list})
+            elif action == 'battle_replay':
+                battle_id = params.get('battle_id')
+                cur.execute(BATTLE_REPLAY_SQL, (battle_id,))
+                battle = cur.fetchone()
+                
+                if not battle:
+                    return error_response('Battle not found', 404)
+                
+                replayed = replay(battle['action_log'] or b'')
+                replayed_winner = replayed.pop('winner_slot')
+                replayed['winner_id'] = battle[f'player{replayed_winner}_id'] if replayed_winner else None
+                stored = {key: battle[key] for key in ('player1_hp', 'player2_hp', 'status', 'winner_id')}
+                return success_response({
+                    'success': True,
+                    'stored': stored,
+                    'replayed': replayed,
+                    'consistent': (replayed['player1_hp'] == stored['player1_hp']
+                                   and replayed['player2_hp'] == stored['player2_hp']
+                                   and replayed['winner_id'] == stored['winner_id'])
+                })
             
-            elif action == 'admin_get_powers':
-                cur.execute("""
-                    SELECT p.id, p.name, p.rarity_id, r.name as rarity_name, r.color,
-                           p.power_type, p.cooldown, p.damage, p.shield_duration
-                    FROM powers_new p 
-                    JOIN rarities r ON p.rarity_id = r.id 
-                    ORDER BY p.id DESC
-                """)
-                powers = cur.fetchall()
-                return success_response({'success': True, 'powers': [dict(p) for p in powers]})
+            elif action and action.startswith('admin_'):
+                # Admin code is imported on first use to keep it out of the cold start
+                from admin import handle_admin_get
+                response = handle_admin_get(cur, action, params)
+                if response:
+                    return response
             
             elif action == 'get_user_powers':
                 user_id = params.get('user_id')
-                cur.execute("""
-                    SELECT p.id, p.name, p.power_type, p.cooldown, p.damage, p.shield_duration, up.equipped_slot
-                    FROM user_powers up
-                    JOIN powers_new p ON up.power_id = p.id
-                    WHERE up.user_id = %s AND up.equipped_slot IS NOT NULL
-                    ORDER BY up.equipped_slot
-                """, (user_id,))
+                cur.execute(USER_POWERS_SQL, (user_id,))
                 powers = cur.fetchall()
                 return success_response({'success': True, 'powers': [dict(p) for p in powers]})
             
             elif action == 'get_user_slots':
                 user_id = params.get('user_id')
-                cur.execute("SELECT slot2_unlocked, slot3_unlocked FROM users WHERE id = %s", (user_id,))
+                cur.execute(USER_SLOTS_SQL, (user_id,))
                 user = cur.fetchone()
                 if not user:
                     return error_response('User not found', 404)
@@ -120,30 +386,24 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         if method != 'POST':
             return error_response('Method not allowed', 405)
         
-        body_data = json.loads(event.get('body', '{}'))
         action = body_data.get('action')
         user_id = body_data.get('user_id')
         
         # Matchmaking actions
         if action == 'find_match':
-            cur.execute("DELETE FROM matchmaking_queue WHERE joined_at < NOW() - INTERVAL '25 seconds'")
+            cur.execute(QUEUE_EXPIRE_SQL)
             conn.commit()
             
-            cur.execute(
-                "SELECT user_id FROM matchmaking_queue WHERE user_id != %s ORDER BY joined_at LIMIT 1",
-                (user_id,)
-            )
+            cur.execute(QUEUE_OPPONENT_SQL, (user_id,))
             opponent = cur.fetchone()
             
             if opponent:
                 opponent_id = opponent['user_id']
-                cur.execute(
-                    "INSERT INTO battles (player1_id, player2_id, player1_hp, player2_hp, status) VALUES (%s, %s, 100, 100, 'active') RETURNING id",
-                    (user_id, opponent_id)
-                )
+                cur.execute(START_BATTLE_SQL, (user_id, opponent_id, BATTLE_IDLE_TIMEOUT_SECONDS))
                 battle_id = cur.fetchone()['id']
-                cur.execute("DELETE FROM matchmaking_queue WHERE user_id IN (%s, %s)", (user_id, opponent_id))
+                cur.execute(QUEUE_LEAVE_SQL, (user_id, opponent_id))
                 conn.commit()
+                touch_battle(battle_id)
                 
                 return success_response({
                     'matched': True,
@@ -151,74 +411,54 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     'opponent_id': opponent_id
                 })
             else:
-                cur.execute(
-                    "INSERT INTO matchmaking_queue (user_id) VALUES (%s) ON CONFLICT DO NOTHING",
-                    (user_id,)
-                )
+                cur.execute(QUEUE_JOIN_SQL, (user_id,))
                 conn.commit()
                 return success_response({'matched': False, 'searching': True})
         
         elif action == 'cancel_search':
-            cur.execute("DELETE FROM matchmaking_queue WHERE user_id = %s", (user_id,))
-            cur.execute("UPDATE users SET money = money + 10 WHERE id = %s RETURNING money", (user_id,))
-            result = cur.fetchone()
+            cur.execute(QUEUE_LEAVE_SQL, (user_id, user_id))
+            cur.execute(CANCEL_SEARCH_REWARD_SQL, (CANCEL_SEARCH_REWARD, user_id))
             conn.commit()
+            result = get_balance(cur, user_id)
             
             if result:
-                return success_response({'success': True, 'reward': 10, 'money': result['money']})
+                return success_response({'success': True, 'reward': CANCEL_SEARCH_REWARD, 'money': result['money']})
             return error_response('User not found', 404)
         
         # Battle actions
         elif action == 'attack':
             battle_id = body_data.get('battle_id')
-            return handle_attack(cur, conn, battle_id, user_id, 7)
+            return handle_attack(cur, conn, battle_id, user_id, BASE_ATTACK_DAMAGE)
+        
+        elif action == 'attack_batch':
+            battle_id = body_data.get('battle_id')
+            clicks = body_data.get('clicks')
+            if not isinstance(clicks, list) or not clicks or len(clicks) > ATTACK_BATCH_MAX_CLICKS:
+                return error_response(f'clicks must be a list of 1-{ATTACK_BATCH_MAX_CLICKS} timestamps', 400)
+            try:
+                clicks = [int(ts) for ts in clicks]
+            except (TypeError, ValueError):
+                return error_response('Invalid click timestamp', 400)
+            return handle_attack_batch(cur, conn, battle_id, user_id, clicks)
         
         elif action == 'use_power':
             battle_id = body_data.get('battle_id')
             power_id = body_data.get('power_id')
             return handle_power_use(cur, conn, battle_id, user_id, power_id)
         
-        # Admin actions
-        elif action == 'admin_create_power':
-            return admin_create_power(cur, conn, body_data)
-        
-        elif action == 'admin_delete_power':
-            power_id = body_data.get('power_id')
-            cur.execute("DELETE FROM powers_new WHERE id = %s", (power_id,))
-            conn.commit()
-            return success_response({'success': True})
-        
-        elif action == 'admin_create_rarity':
-            name = body_data.get('name')
-            drop_chance = body_data.get('drop_chance')
-            color = body_data.get('color')
-            cur.execute(
-                "INSERT INTO rarities (name, drop_chance, color) VALUES (%s, %s, %s)",
-                (name, drop_chance, color)
-            )
-            conn.commit()
-            return success_response({'success': True})
-        
-        elif action == 'admin_delete_rarity':
-            rarity_id = body_data.get('rarity_id')
-            cur.execute("DELETE FROM rarities WHERE id = %s", (rarity_id,))
-            conn.commit()
-            return success_response({'success': True})
-        
-        elif action == 'admin_create_rarity':
-            return admin_create_rarity(cur, conn, body_data)
+        elif action == 'compact_ledger':
+            users = compact_ledger(cur, conn, min(int(body_data.get('limit') or LEDGER_COMPACT_BATCH_SIZE), 5000))
+            return success_response({'success': True, 'users': users})
         
-        elif action == 'admin_delete_rarity':
-            return admin_delete_rarity(cur, conn, body_data)
+        elif action == 'expire_battles':
+            finished = finish_idle_battles(cur, conn, None, min(int(body_data.get('limit') or EXPIRE_BATCH_SIZE), 1000))
+            return success_response({'success': True, 'finished': finished})
         
-        elif action == 'admin_delete_power':
-            return admin_delete_power(cur, conn, body_data)
-        
-        elif action == 'admin_give_spins':
-            return admin_give_resource(cur, conn, body_data, 'spins')
-        
-        elif action == 'admin_give_money':
-            return admin_give_resource(cur, conn, body_data, 'money')
+        elif action and action.startswith('admin_'):
+            from admin import handle_admin_post
+            response = handle_admin_post(cur, conn, action, body_data)
+            if response:
+                return response
         
         elif action == 'buy_slot':
             slot_number = body_data.get('slot_number')
@@ -228,8 +468,10 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             cost = 1000 if slot_number == 2 else 2000
             slot_column = f'slot{slot_number}_unlocked'
             
-            cur.execute(f"SELECT money, {slot_column} FROM users WHERE id = %s", (user_id,))
+            apply_pending_ledger(cur, user_id)
+            cur.execute(BUY_SLOT_USER_SQL.format(slot_column=slot_column), (user_id,))
             user = cur.fetchone()
+            conn.commit()
             
             if not user:
                 return error_response('User not found', 404)
@@ -240,13 +482,13 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             if user['money'] < cost:
                 return error_response('Not enough money', 400)
             
-            cur.execute(
-                f"UPDATE users SET money = money - %s, {slot_column} = TRUE WHERE id = %s RETURNING money",
-                (cost, user_id)
-            )
+            cur.execute(BUY_SLOT_DEBIT_SQL.format(slot_column=slot_column), (cost, user_id, cost, cost))
             result = cur.fetchone()
             conn.commit()
             
+            if not result:
+                return error_response('Not enough money', 400)
+            
             return success_response({'success': True, 'money': result['money'], 'slot_unlocked': slot_number})
         
         return error_response('Invalid action', 400)
@@ -256,177 +498,229 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         return error_response(str(e), 500)
     finally:
         cur.close()
-        conn.close()
+        release_connection(conn)
 
 
-def handle_attack(cur, conn, battle_id: int, attacker_id: int, damage: int) -> Dict[str, Any]:
-    cur.execute(
-        """SELECT player1_id, player2_id, player1_hp, player2_hp, player1_shield_until, 
-           player2_shield_until, player1_counter_until, player2_counter_until, 
-           player1_counter_damage, player2_counter_damage, status 
-           FROM battles WHERE id = %s""",
-        (battle_id,)
-    )
+def handle_attack(cur, conn, battle_id: int, attacker_id: int, damage: int,
+                  power_id: int = 0, cooldown: int = 0, now_ms: Optional[int] = None) -> Dict[str, Any]:
+    cur.execute(ATTACK_BATTLE_SQL, (battle_id,))
     battle = cur.fetchone()
     
     if not battle or battle['status'] != 'active':
         return error_response('Battle not active', 400)
     
-    now_ms = int(time.time() * 1000)
+    if now_ms is None:
+        now_ms = int(time.time() * 1000)
     is_player1 = attacker_id == battle['player1_id']
     
     if not is_player1 and attacker_id != battle['player2_id']:
         return error_response('Not a participant', 403)
     
-    # Check if defender has shield
-    if is_player1:
-        if now_ms < battle['player2_shield_until']:
-            return success_response({'success': True, 'blocked': True, 'message': 'Attack blocked by shield!'})
-        
-        # Check if defender has counter
-        if now_ms < battle['player2_counter_until']:
-            counter_damage = battle['player2_counter_damage']
-            player1_hp = battle['player1_hp'] - counter_damage
-            player2_hp = battle['player2_hp']
-            cur.execute(
-                "UPDATE battles SET player2_counter_until = 0, player1_hp = %s WHERE id = %s",
-                (player1_hp, battle_id)
-            )
-            conn.commit()
-            
-            winner_id, finished = check_battle_end(cur, conn, battle_id, player1_hp, player2_hp, battle['player1_id'], battle['player2_id'])
-            return success_response({
-                'success': True,
-                'countered': True,
-                'damage_taken': counter_damage,
-                'player1_hp': player1_hp,
-                'player2_hp': player2_hp,
-                'finished': finished,
-                'winner_id': winner_id
-            })
-        
-        player2_hp = battle['player2_hp'] - damage
-        cur.execute("UPDATE battles SET player2_hp = %s WHERE id = %s", (player2_hp, battle_id))
+    attacker = 1 if is_player1 else 2
+    kind = ACTION_POWER_ATTACK if power_id else ACTION_ATTACK
+    record = psycopg2.Binary(encode_action(now_ms, attacker, kind, power_id, damage, cooldown))
+    
+    state = dict(battle)
+    outcome, hp_lost = resolve_attack(state, attacker, damage, now_ms)
+    
+    if outcome == 'blocked':
+        cur.execute(
+            f"UPDATE battles SET action_log = action_log || %s, {ACTIVITY_COLUMNS} WHERE id = %s",
+            (record, attacker, BATTLE_IDLE_TIMEOUT_SECONDS, battle_id)
+        )
+        conn.commit()
+        touch_battle(battle_id)
+        return success_response({'success': True, 'blocked': True, 'message': 'Attack blocked by shield!'})
+    
+    player1_hp = state['player1_hp']
+    player2_hp = state['player2_hp']
+    defender = 3 - attacker
+    if outcome == 'countered':
+        cur.execute(
+            f"""UPDATE battles SET player{defender}_counter_until = 0, player{attacker}_hp = %s, 
+                action_log = action_log || %s, {ACTIVITY_COLUMNS} WHERE id = %s""",
+            (state[f'player{attacker}_hp'], record, attacker, BATTLE_IDLE_TIMEOUT_SECONDS, battle_id)
+        )
     else:
-        if now_ms < battle['player1_shield_until']:
-            return success_response({'success': True, 'blocked': True, 'message': 'Attack blocked by shield!'})
-        
-        if now_ms < battle['player1_counter_until']:
-            counter_damage = battle['player1_counter_damage']
-            player2_hp = battle['player2_hp'] - counter_damage
-            player1_hp = battle['player1_hp']
-            cur.execute(
-                "UPDATE battles SET player1_counter_until = 0, player2_hp = %s WHERE id = %s",
-                (player2_hp, battle_id)
-            )
-            conn.commit()
-            
-            winner_id, finished = check_battle_end(cur, conn, battle_id, player1_hp, player2_hp, battle['player1_id'], battle['player2_id'])
-            return success_response({
-                'success': True,
-                'countered': True,
-                'damage_taken': counter_damage,
-                'player1_hp': player1_hp,
-                'player2_hp': player2_hp,
-                'finished': finished,
-                'winner_id': winner_id
-            })
-        
-        player1_hp = battle['player1_hp'] - damage
-        cur.execute("UPDATE battles SET player1_hp = %s WHERE id = %s", (player1_hp, battle_id))
+        cur.execute(
+            f"UPDATE battles SET player{defender}_hp = %s, action_log = action_log || %s, {ACTIVITY_COLUMNS} WHERE id = %s",
+            (state[f'player{defender}_hp'], record, attacker, BATTLE_IDLE_TIMEOUT_SECONDS, battle_id)
+        )
+    touch_battle(battle_id)
     
+    # Commit together with the end check so no other action reads the new HP of a battle still marked active
+    winner_id, finished = check_battle_end(cur, conn, battle_id, player1_hp, player2_hp,
+                                           battle['player1_id'], battle['player2_id'])
     conn.commit()
     
-    winner_id, finished = check_battle_end(cur, conn, battle_id, 
-        player1_hp if not is_player1 else battle['player1_hp'], 
-        player2_hp if is_player1 else battle['player2_hp'],
-        battle['player1_id'], battle['player2_id'])
+    if outcome == 'countered':
+        return success_response({
+            'success': True,
+            'countered': True,
+            'damage_taken': hp_lost,
+            'player1_hp': player1_hp,
+            'player2_hp': player2_hp,
+            'finished': finished,
+            'winner_id': winner_id
+        })
     
     return success_response({
         'success': True,
-        'player1_hp': player1_hp if not is_player1 else battle['player1_hp'],
-        'player2_hp': player2_hp if is_player1 else battle['player2_hp'],
+        'player1_hp': player1_hp,
+        'player2_hp': player2_hp,
         'finished': finished,
         'winner_id': winner_id
     })
 
 
-def handle_power_use(cur, conn, battle_id: int, user_id: int, power_id: int) -> Dict[str, Any]:
-    # Check cooldown
+def handle_attack_batch(cur, conn, battle_id: int, attacker_id: int, clicks: List[int]) -> Dict[str, Any]:
+    '''Resolve buffered basic attacks merged by timestamp with the logged actions of both players, then persist once'''
+    cur.execute(ATTACK_BATCH_BATTLE_SQL, (battle_id,))
+    battle = cur.fetchone()
+    
+    if not battle or battle['status'] != 'active':
+        return error_response('Battle not active', 400)
+    
+    is_player1 = attacker_id == battle['player1_id']
+    if not is_player1 and attacker_id != battle['player2_id']:
+        return error_response('Not a participant', 403)
+    
+    # The batch re-simulates the battle from its log, which is only complete for
+    # battles started after the log existed (V0008); older ones keep single attacks
+    log = battle['action_log'] or b''
+    replayed = replay(log)
+    if (replayed['player1_hp'], replayed['player2_hp']) != (battle['player1_hp'], battle['player2_hp']):
+        return error_response('Battle history is incomplete, send single attacks', 409)
+    
+    attacker = 1 if is_player1 else 2
+    now_ms = int(time.time() * 1000)
+    # Clicks can only come from the buffering window that just ended
+    clicks = [min(max(ts, now_ms - ATTACK_BATCH_WINDOW_MS), now_ms) for ts in clicks]
+    
+    # Clicks are merged into the log by timestamp, but never before the opponent's
+    # latest logged action, so the battle is re-simulated with them in place
+    state, outcomes, records = resolve_batch(log, attacker, clicks, BASE_ATTACK_DAMAGE)
+    counts = {'hit': 0, 'blocked': 0, 'countered': 0, 'rejected': 0}
+    damage_taken = 0
+    for outcome, hp_lost in outcomes:
+        counts[outcome] += 1
+        if outcome == 'countered':
+            damage_taken += hp_lost
+    
+    player1_hp = state['player1_hp']
+    player2_hp = state['player2_hp']
     cur.execute(
-        "SELECT can_use_at FROM battle_cooldowns WHERE battle_id = %s AND user_id = %s AND power_id = %s",
-        (battle_id, user_id, power_id)
+        f"""UPDATE battles SET player1_hp = %s, player2_hp = %s, 
+            player1_shield_until = %s, player2_shield_until = %s, 
+            player1_counter_until = %s, player2_counter_until = %s, 
+            player1_counter_damage = %s, player2_counter_damage = %s, 
+            action_log = action_log || %s, {ACTIVITY_COLUMNS} WHERE id = %s""",
+        (player1_hp, player2_hp, state['player1_shield_until'], state['player2_shield_until'],
+         state['player1_counter_until'], state['player2_counter_until'],
+         state['player1_counter_damage'], state['player2_counter_damage'],
+         psycopg2.Binary(records), attacker, BATTLE_IDLE_TIMEOUT_SECONDS, battle_id)
     )
+    touch_battle(battle_id)
+    
+    # Commit together with the end check so no other action reads the new HP of a battle still marked active
+    winner_id, finished = check_battle_end(cur, conn, battle_id, player1_hp, player2_hp,
+                                           battle['player1_id'], battle['player2_id'])
+    conn.commit()
+    
+    return success_response({
+        'success': True,
+        'applied': len(outcomes) - counts['rejected'],
+        'hits': counts['hit'],
+        'blocked': counts['blocked'],
+        'countered': counts['countered'],
+        'damage_taken': damage_taken,
+        'player1_hp': player1_hp,
+        'player2_hp': player2_hp,
+        'finished': finished,
+        'winner_id': winner_id
+    })
+
+
+def handle_power_use(cur, conn, battle_id: int, user_id: int, power_id: int) -> Dict[str, Any]:
+    # Get battle; the row lock also serializes the cooldown check below
+    cur.execute(POWER_USE_BATTLE_SQL, (battle_id,))
+    battle = cur.fetchone()
+    
+    if not battle or battle['status'] != 'active':
+        return error_response('Battle not active', 400)
+    
+    if user_id not in (battle['player1_id'], battle['player2_id']):
+        return error_response('Not a participant', 403)
+    
+    # Check cooldown
+    cur.execute(POWER_COOLDOWN_SQL, (battle_id, user_id, power_id))
     cooldown = cur.fetchone()
     now_ms = int(time.time() * 1000)
     
     if cooldown and now_ms < cooldown['can_use_at']:
         return error_response('Power on cooldown', 400)
     
-    # Get power details
-    cur.execute(
-        "SELECT * FROM powers_new WHERE id = %s",
-        (power_id,)
-    )
-    power = cur.fetchone()
+    # Get power details; from here on power_id is the catalog's integer id
+    power = get_power(cur, power_id)
     
     if not power:
         return error_response('Power not found', 404)
+    power_id = power['id']
     
-    # Get battle
-    cur.execute(
-        "SELECT * FROM battles WHERE id = %s",
-        (battle_id,)
-    )
-    battle = cur.fetchone()
-    
-    if not battle or battle['status'] != 'active':
-        return error_response('Battle not active', 400)
+    # Set cooldown; committed with the effect below
+    next_use = now_ms + (power['cooldown'] * 1000)
+    cur.execute(SET_POWER_COOLDOWN_SQL, (battle_id, user_id, power_id, next_use, next_use))
     
-    is_player1 = user_id == battle['player1_id']
+    player = 1 if user_id == battle['player1_id'] else 2
+    state: Dict[str, Any] = {}
     
     # Apply power effect
     if power['power_type'] == 'attack':
-        result = handle_attack(cur, conn, battle_id, user_id, power['damage'])
+        result = handle_attack(cur, conn, battle_id, user_id, power['damage'],
+                               power_id=power_id, cooldown=power['cooldown'], now_ms=now_ms)
     elif power['power_type'] == 'defense':
-        shield_until = now_ms + (power['shield_duration'] * 1000)
-        if is_player1:
-            cur.execute("UPDATE battles SET player1_shield_until = %s WHERE id = %s", (shield_until, battle_id))
-        else:
-            cur.execute("UPDATE battles SET player2_shield_until = %s WHERE id = %s", (shield_until, battle_id))
+        activate_shield(state, player, power['shield_duration'], now_ms)
+        record = encode_action(now_ms, player, ACTION_SHIELD, power_id, power['shield_duration'], power['cooldown'])
+        cur.execute(
+            f"""UPDATE battles SET player{player}_shield_until = %s, action_log = action_log || %s, 
+                {ACTIVITY_COLUMNS} WHERE id = %s""",
+            (state[f'player{player}_shield_until'], psycopg2.Binary(record), player, BATTLE_IDLE_TIMEOUT_SECONDS, battle_id)
+        )
         conn.commit()
+        touch_battle(battle_id)
         result = success_response({'success': True, 'message': f'Shield active for {power["shield_duration"]}s'})
     elif power['power_type'] == 'counter':
-        counter_until = now_ms + 3000
-        if is_player1:
-            cur.execute(
-                "UPDATE battles SET player1_counter_until = %s, player1_counter_damage = %s WHERE id = %s",
-                (counter_until, power['damage'], battle_id)
-            )
-        else:
-            cur.execute(
-                "UPDATE battles SET player2_counter_until = %s, player2_counter_damage = %s WHERE id = %s",
-                (counter_until, power['damage'], battle_id)
-            )
+        activate_counter(state, player, power['damage'], now_ms)
+        record = encode_action(now_ms, player, ACTION_COUNTER, power_id, power['damage'], power['cooldown'])
+        cur.execute(
+            f"""UPDATE battles SET player{player}_counter_until = %s, player{player}_counter_damage = %s, 
+                action_log = action_log || %s, {ACTIVITY_COLUMNS} WHERE id = %s""",
+            (state[f'player{player}_counter_until'], power['damage'], psycopg2.Binary(record),
+             player, BATTLE_IDLE_TIMEOUT_SECONDS, battle_id)
+        )
         conn.commit()
-        result = success_response({'success': True, 'message': 'Counter active for 3s'})
+        touch_battle(battle_id)
+        result = success_response({'success': True, 'message': f'Counter active for {COUNTER_WINDOW_MS // 1000}s'})
     else:
         return error_response('Invalid power type', 400)
     
-    # Set cooldown
-    next_use = now_ms + (power['cooldown'] * 1000)
-    cur.execute(
-        """INSERT INTO battle_cooldowns (battle_id, user_id, power_id, can_use_at) 
-           VALUES (%s, %s, %s, %s) 
-           ON CONFLICT (battle_id, user_id, power_id) 
-           DO UPDATE SET can_use_at = %s""",
-        (battle_id, user_id, power_id, next_use, next_use)
-    )
-    conn.commit()
-    
     return result
 
 
+def get_power(cur, power_id) -> Optional[Dict[str, Any]]:
+    try:
+        power_id = int(power_id)
+    except (TypeError, ValueError):
+        return None
+    
+    # A miss may be a power created after the cache was filled
+    if _powers_cache['expires_at'] < time.monotonic() or power_id not in _powers_cache['powers']:
+        cur.execute(POWERS_SQL)
+        _powers_cache['powers'] = {row['id']: row for row in cur.fetchall()}
+        _powers_cache['expires_at'] = time.monotonic() + POWERS_TTL_SECONDS
+    return _powers_cache['powers'].get(power_id)
+
+
 def check_battle_end(cur, conn, battle_id: int, p1_hp: int, p2_hp: int, p1_id: int, p2_id: int):
     winner_id = None
     finished = False
@@ -434,121 +728,65 @@ def check_battle_end(cur, conn, battle_id: int, p1_hp: int, p2_hp: int, p1_id: i
     if p1_hp <= 0:
         winner_id = p2_id
         finished = True
-        cur.execute("UPDATE users SET wins = wins + 1, money = money + 100, spins = spins + 1 WHERE id = %s", (p2_id,))
-        cur.execute("UPDATE users SET losses = losses + 1 WHERE id = %s", (p1_id,))
-        cur.execute("UPDATE battles SET status = 'finished', winner_id = %s WHERE id = %s", (winner_id, battle_id))
+        cur.execute(BATTLE_RESULT_SQL, (p2_id, WIN_MONEY_REWARD, WIN_SPINS_REWARD, p1_id))
+        finish_battle(cur, battle_id, winner_id)
         conn.commit()
     elif p2_hp <= 0:
         winner_id = p1_id
         finished = True
-        cur.execute("UPDATE users SET wins = wins + 1, money = money + 100, spins = spins + 1 WHERE id = %s", (p1_id,))
-        cur.execute("UPDATE users SET losses = losses + 1 WHERE id = %s", (p2_id,))
-        cur.execute("UPDATE battles SET status = 'finished', winner_id = %s WHERE id = %s", (winner_id, battle_id))
+        cur.execute(BATTLE_RESULT_SQL, (p1_id, WIN_MONEY_REWARD, WIN_SPINS_REWARD, p2_id))
+        finish_battle(cur, battle_id, winner_id)
         conn.commit()
     
+    if finished:
+        _battle_timers.cancel(battle_id)
+    
     return winner_id, finished
 
 
-def admin_create_power(cur, conn, data: Dict[str, Any]) -> Dict[str, Any]:
-    name = data.get('name')
-    rarity_id = data.get('rarity_id')
-    power_type = data.get('power_type')
-    cooldown = data.get('cooldown', 0)
-    damage = data.get('damage', 0)
-    shield_duration = data.get('shield_duration', 0)
-    
-    cur.execute(
-        """INSERT INTO powers_new (name, rarity_id, power_type, cooldown, damage, shield_duration) 
-           VALUES (%s, %s, %s, %s, %s, %s)""",
-        (name, rarity_id, power_type, cooldown, damage, shield_duration)
-    )
-    conn.commit()
-    return success_response({'success': True})
+def finish_battle(cur, battle_id: int, winner_id: int) -> None:
+    cur.execute(FINISH_BATTLE_SQL, (winner_id, battle_id))
 
 
-def admin_get_rarities(cur) -> Dict[str, Any]:
-    cur.execute("SELECT id, name, drop_chance, color FROM rarities ORDER BY drop_chance DESC")
-    rarities = cur.fetchall()
-    return success_response({
-        'success': True,
-        'rarities': [dict(r) for r in rarities]
-    })
+def get_balance(cur, user_id) -> Optional[Dict[str, Any]]:
+    cur.execute(BALANCE_SQL, (user_id,))
+    return cur.fetchone()
 
 
-def admin_get_powers(cur) -> Dict[str, Any]:
-    cur.execute("""
-        SELECT p.id, p.name, p.rarity_id, r.name as rarity_name, 
-               p.power_type, p.cooldown, p.damage, p.shield_duration
-        FROM powers_new p
-        JOIN rarities r ON p.rarity_id = r.id
-        ORDER BY p.id DESC
-    """)
-    powers = cur.fetchall()
-    return success_response({
-        'success': True,
-        'powers': [dict(p) for p in powers]
-    })
+def apply_pending_ledger(cur, user_id) -> None:
+    '''Fold one user's pending entries into users before a spend; the caller commits'''
+    cur.execute(APPLY_PENDING_LEDGER_SQL, (user_id, user_id))
 
 
-def admin_create_rarity(cur, conn, data: Dict[str, Any]) -> Dict[str, Any]:
-    name = data.get('name')
-    drop_chance = data.get('drop_chance')
-    color = data.get('color', '#6B7280')
+def compact_ledger(cur, conn, limit: int) -> int:
+    '''Fold the oldest pending ledger entries into users balances, one row update per user'''
+    cur.execute(LEDGER_CLAIM_SQL, (limit,))
+    batch = cur.fetchall()
+    if not batch:
+        conn.commit()
+        return 0
     
-    cur.execute(
-        "INSERT INTO rarities (name, drop_chance, color) VALUES (%s, %s, %s)",
-        (name, drop_chance, color)
-    )
+    # Users are locked in id order first, so two compactions (or a compaction and
+    # a single-user fold) over overlapping users cannot deadlock
+    cur.execute(LEDGER_LOCK_USERS_SQL, (sorted({row['user_id'] for row in batch}),))
+    cur.execute(LEDGER_APPLY_SQL, ([row['id'] for row in batch],))
+    users = cur.rowcount
     conn.commit()
-    return success_response({'success': True})
+    return users
 
 
-def admin_delete_rarity(cur, conn, data: Dict[str, Any]) -> Dict[str, Any]:
-    rarity_id = data.get('rarity_id')
-    
-    cur.execute("DELETE FROM powers_new WHERE rarity_id = %s", (rarity_id,))
-    cur.execute("DELETE FROM rarities WHERE id = %s", (rarity_id,))
-    conn.commit()
-    return success_response({'success': True})
+def touch_battle(battle_id: int) -> None:
+    _battle_timers.schedule(battle_id, int(time.time() * 1000) + BATTLE_IDLE_TIMEOUT_SECONDS * 1000)
 
 
-def admin_delete_power(cur, conn, data: Dict[str, Any]) -> Dict[str, Any]:
-    power_id = data.get('power_id')
-    
-    cur.execute("DELETE FROM powers_new WHERE id = %s", (power_id,))
+def finish_idle_battles(cur, conn, battle_ids: Optional[List[int]], limit: int = EXPIRE_BATCH_SIZE) -> int:
+    '''Finish active battles past their idle deadline with one statement; battle_ids=None sweeps all of them'''
+    cur.execute(EXPIRE_BATTLES_SQL, (BATTLE_IDLE_TIMEOUT_SECONDS, battle_ids, battle_ids, limit,
+                                     WIN_MONEY_REWARD, WIN_SPINS_REWARD))
+    finished_ids = [row['id'] for row in cur.fetchall()]
     conn.commit()
-    return success_response({'success': True})
-
-
-def admin_give_resource(cur, conn, data: Dict[str, Any], resource: str) -> Dict[str, Any]:
-    target = data.get('target')
-    amount = data.get('amount')
-    
-    if target == 'all':
-        cur.execute(f"UPDATE users SET {resource} = {resource} + %s", (amount,))
-    else:
-        nick = data.get('nick')
-        cur.execute(f"UPDATE users SET {resource} = {resource} + %s WHERE nick = %s", (amount, nick))
-        if cur.rowcount == 0:
-            return error_response('User not found', 404)
     
-    conn.commit()
-    return success_response({'success': True})
-
-
-def success_response(data: Dict[str, Any]) -> Dict[str, Any]:
-    return {
-        'statusCode': 200,
-        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-        'body': json.dumps(data),
-        'isBase64Encoded': False
-    }
-
+    for battle_id in finished_ids:
+        _battle_timers.cancel(battle_id)
+    return len(finished_ids)
 
-def error_response(message: str, status_code: int = 400) -> Dict[str, Any]:
-    return {
-        'statusCode': status_code,
-        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-        'body': json.dumps({'error': message}),
-        'isBase64Encoded': False
-    }
\ No newline at end of file
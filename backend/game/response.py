@@ -0,0 +1,103 @@
+'''
+Business: HTTP response helpers shared by the function handlers
+Args: response payloads, status codes and the incoming event for content negotiation
+Returns: platform response dicts with JSON body, static headers, ETag and optional gzip
+'''
+
+import base64
+import gzip
+import hashlib
+import json
+from typing import Dict, Any, Optional
+
+try:
+    import orjson
+    
+    def dumps(data: Any) -> str:
+        return orjson.dumps(data).decode()
+except ImportError:
+    def dumps(data: Any) -> str:
+        return json.dumps(data, separators=(',', ':'))
+
+# Bodies below this size gain less from compression than base64 costs
+GZIP_MIN_BYTES = 1024
+
+JSON_HEADERS = {
+    'Content-Type': 'application/json',
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Expose-Headers': 'X-Primary-Until'
+}
+_options_cache: Dict[str, Dict[str, Any]] = {}
+
+
+def success_response(data: Any, status_code: int = 200) -> Dict[str, Any]:
+    return {
+        'statusCode': status_code,
+        'headers': JSON_HEADERS,
+        'body': dumps(data),
+        'isBase64Encoded': False
+    }
+
+
+def error_response(message: str, status_code: int = 400) -> Dict[str, Any]:
+    return success_response({'error': message}, status_code)
+
+
+def options_response(methods: str, allow_headers: str) -> Dict[str, Any]:
+    key = f'{methods}|{allow_headers}'
+    if key not in _options_cache:
+        _options_cache[key] = {
+            'statusCode': 200,
+            'headers': {
+                'Access-Control-Allow-Origin': '*',
+                'Access-Control-Allow-Methods': methods,
+                'Access-Control-Allow-Headers': allow_headers,
+                'Access-Control-Max-Age': '86400'
+            },
+            'body': '',
+            'isBase64Encoded': False
+        }
+    return _options_cache[key]
+
+
+def get_header(event: Dict[str, Any], name: str) -> Optional[str]:
+    headers = event.get('headers') or {}
+    lowered = name.lower()
+    for key, value in headers.items():
+        if key.lower() == lowered:
+            return value
+    return None
+
+
+def with_header(response: Dict[str, Any], name: str, value: Optional[str]) -> Dict[str, Any]:
+    if value is None:
+        return response
+    return {**response, 'headers': {**response['headers'], name: value}}
+
+
+def finalize_response(event: Dict[str, Any], response: Dict[str, Any]) -> Dict[str, Any]:
+    '''Add a weak ETag to successful GETs (304 on a match) and gzip large bodies for clients that accept it'''
+    if response.get('isBase64Encoded') or not response.get('body'):
+        return response
+    
+    body: str = response['body']
+    headers = response['headers']
+    
+    if event.get('httpMethod') == 'GET' and response['statusCode'] == 200:
+        # Weak validator: the same tag covers the identity and the gzip encoding of the body
+        etag = 'W/"' + hashlib.blake2b(body.encode(), digest_size=12).hexdigest() + '"'
+        if etag in [tag.strip() for tag in (get_header(event, 'If-None-Match') or '').split(',')]:
+            return {'statusCode': 304, 'headers': {**headers, 'ETag': etag}, 'body': '', 'isBase64Encoded': False}
+        headers = {**headers, 'ETag': etag}
+    
+    if len(body) >= GZIP_MIN_BYTES and 'gzip' in (get_header(event, 'Accept-Encoding') or ''):
+        return {
+            'statusCode': response['statusCode'],
+            'headers': {**headers, 'Content-Encoding': 'gzip', 'Vary': 'Accept-Encoding'},
+            'body': base64.b64encode(gzip.compress(body.encode(), compresslevel=5)).decode(),
+            'isBase64Encoded': True
+        }
+    
+    if headers is response['headers']:
+        return response
+    return {**response, 'headers': headers}
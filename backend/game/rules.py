@@ -0,0 +1,59 @@
+'''
+Business: Pure battle rules shared by the live handlers and the replay engine
+Args: battle state dict with the player1_*/player2_* columns of battles
+Returns: mutated state and the outcome of each action
+'''
+
+from typing import Dict, Any, Optional, Tuple
+
+START_HP = 100
+BASE_ATTACK_DAMAGE = 7
+COUNTER_WINDOW_MS = 3000
+
+
+def new_battle_state(start_hp: int = START_HP) -> Dict[str, Any]:
+    return {
+        'player1_hp': start_hp,
+        'player2_hp': start_hp,
+        'player1_shield_until': 0,
+        'player2_shield_until': 0,
+        'player1_counter_until': 0,
+        'player2_counter_until': 0,
+        'player1_counter_damage': 0,
+        'player2_counter_damage': 0
+    }
+
+
+def resolve_attack(state: Dict[str, Any], attacker: int, damage: int, now_ms: int) -> Tuple[str, int]:
+    '''Apply one attack of player slot 1 or 2; returns (outcome, hp lost) with outcome blocked/countered/hit'''
+    own = f'player{attacker}'
+    foe = f'player{3 - attacker}'
+    
+    if now_ms < state[f'{foe}_shield_until']:
+        return 'blocked', 0
+    
+    if now_ms < state[f'{foe}_counter_until']:
+        counter_damage = state[f'{foe}_counter_damage']
+        state[f'{foe}_counter_until'] = 0
+        state[f'{own}_hp'] -= counter_damage
+        return 'countered', counter_damage
+    
+    state[f'{foe}_hp'] -= damage
+    return 'hit', damage
+
+
+def activate_shield(state: Dict[str, Any], player: int, duration_s: int, now_ms: int) -> None:
+    state[f'player{player}_shield_until'] = now_ms + duration_s * 1000
+
+
+def activate_counter(state: Dict[str, Any], player: int, damage: int, now_ms: int) -> None:
+    state[f'player{player}_counter_until'] = now_ms + COUNTER_WINDOW_MS
+    state[f'player{player}_counter_damage'] = damage
+
+
+def winner_slot(state: Dict[str, Any]) -> Optional[int]:
+    if state['player1_hp'] <= 0:
+        return 2
+    if state['player2_hp'] <= 0:
+        return 1
+    return None
@@ -0,0 +1,44 @@
+'''
+Business: In-process timer heap for battle idle deadlines
+Args: battle ids with their deadline in epoch milliseconds
+Returns: batches of battle ids whose deadline has passed
+'''
+
+import heapq
+from typing import Dict, List, Tuple
+
+
+class BattleTimers:
+    '''Min-heap of deadlines; rescheduling leaves the old entry in place and it is skipped when popped'''
+    
+    def __init__(self) -> None:
+        self._heap: List[Tuple[int, int]] = []
+        self._deadlines: Dict[int, int] = {}
+    
+    def __len__(self) -> int:
+        return len(self._deadlines)
+    
+    def schedule(self, battle_id: int, due_ms: int) -> None:
+        self._deadlines[battle_id] = due_ms
+        heapq.heappush(self._heap, (due_ms, battle_id))
+        # Keep superseded entries from piling up on long-lived instances
+        if len(self._heap) > 4 * len(self._deadlines) + 64:
+            self._heap = [(due, bid) for bid, due in self._deadlines.items()]
+            heapq.heapify(self._heap)
+    
+    def cancel(self, battle_id: int) -> None:
+        self._deadlines.pop(battle_id, None)
+    
+    def pop_due(self, now_ms: int, limit: int = 100) -> List[int]:
+        due: List[int] = []
+        while self._heap and len(due) < limit:
+            due_ms, battle_id = self._heap[0]
+            if self._deadlines.get(battle_id) != due_ms:
+                heapq.heappop(self._heap)
+                continue
+            if due_ms > now_ms:
+                break
+            heapq.heappop(self._heap)
+            del self._deadlines[battle_id]
+            due.append(battle_id)
+        return due
@@ -0,0 +1,77 @@
+'''
+Business: In-process per-user rate limiting and idempotency cache for write actions
+Args: user id, action name and optional client idempotency key of each request
+Returns: verdict (ok, limited, duplicate) with the cached response for duplicates
+'''
+
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
+
+
+class ActionThrottle:
+    '''Token bucket per (user, action) plus an LRU of recent responses keyed by idempotency key, both bounded in size;
+    actions in shared draw from the bucket of another action'''
+    
+    def __init__(self, limits: Dict[str, Tuple[float, float]], idempotency_ttl: float = 60.0,
+                 max_entries: int = 10000, shared: Optional[Dict[str, str]] = None) -> None:
+        self.limits = limits
+        self.shared = shared or {}
+        self.idempotency_ttl = idempotency_ttl
+        self.max_entries = max_entries
+        self._buckets: 'OrderedDict[Tuple[str, str], list]' = OrderedDict()
+        self._responses: 'OrderedDict[Tuple[str, str, str], Tuple[float, Dict[str, Any]]]' = OrderedDict()
+        self.counters: Dict[str, Dict[str, int]] = {
+            action: {'allowed': 0, 'limited': 0, 'duplicates': 0} for action in [*limits, *self.shared]
+        }
+    
+    def check(self, user_id: Any, action: Optional[str], key: Optional[str] = None,
+              cost: float = 1.0) -> Tuple[str, Optional[Dict[str, Any]]]:
+        '''cost is the number of tokens the request takes, e.g. the clicks of a batched request'''
+        if action not in self.counters:
+            return 'ok', None
+        
+        now = time.monotonic()
+        counters = self.counters[action]
+        
+        if key:
+            cached = self._responses.get((str(user_id), action, key))
+            if cached and cached[0] > now:
+                counters['duplicates'] += 1
+                return 'duplicate', cached[1]
+        
+        bucket_action = self.shared.get(action, action)
+        rate, burst = self.limits[bucket_action]
+        bucket_key = (str(user_id), bucket_action)
+        bucket = self._buckets.pop(bucket_key, None) or [burst, now]
+        bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+        bucket[1] = now
+        self._buckets[bucket_key] = bucket
+        if len(self._buckets) > self.max_entries:
+            self._buckets.popitem(last=False)
+        
+        if bucket[0] < cost:
+            counters['limited'] += 1
+            return 'limited', None
+        
+        bucket[0] -= cost
+        counters['allowed'] += 1
+        return 'ok', None
+    
+    def remember(self, user_id: Any, action: Optional[str], key: Optional[str], response: Dict[str, Any]) -> None:
+        '''Keep the response for retries with the same key; server errors are not cached so a retry runs again'''
+        if not key or action not in self.counters or response.get('statusCode', 500) >= 500:
+            return
+        
+        cache_key = (str(user_id), action, key)
+        self._responses.pop(cache_key, None)
+        self._responses[cache_key] = (time.monotonic() + self.idempotency_ttl, response)
+        if len(self._responses) > self.max_entries:
+            self._responses.popitem(last=False)
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'actions': self.counters,
+            'tracked_users': len(self._buckets),
+            'cached_responses': len(self._responses)
+        }
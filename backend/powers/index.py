@@ -5,209 +5,259 @@ Returns: HTTP response with powers list, inventory, or spin result
 '''
 
 import json
-import os
 import random
-from typing import Dict, Any
-import psycopg2
+import time
+from typing import Dict, Any, List, Tuple
+
+from db import get_connection, release_connection, primary_until
+from throttle import ActionThrottle
+from response import success_response, error_response, options_response, get_header, with_header, finalize_response
+
+# Requests per second and burst per user; over-limit and duplicate requests
+# (same idempotency key) are answered before a database connection is opened
+_throttle = ActionThrottle({
+    'spin': (5.0, 10.0),
+    'spin_many': (1.0, 2.0)
+})
+
+SPIN_MANY_MAX = 500
+
+# Spread over random rows per day like the game function's rollups (see V0011)
+STATS_SHARDS = 16
+STATS_SHARD = f"floor(random() * {STATS_SHARDS})::smallint"
+
+# The catalog changes only through admin actions, so warm instances reuse it
+# for a short while instead of querying it on every catalog view and spin
+CATALOG_TTL_SECONDS = 30
+_catalog_cache: Dict[str, Tuple[float, List[Tuple]]] = {}
+
+# Statements of the request paths, shared with scripts/explain_check.py so the
+# plan check sees exactly what runs here
+CATALOG_SQL = """SELECT p.id, p.name, r.name as rarity_name, p.power_type, p.cooldown, p.damage, p.shield_duration
+                 FROM powers_new p
+                 JOIN rarities r ON p.rarity_id = r.id
+                 ORDER BY r.drop_chance ASC"""
+
+SPIN_POOL_SQL = """SELECT p.id, p.name, r.name as rarity_name, r.color, r.drop_chance
+                   FROM powers_new p
+                   JOIN rarities r ON p.rarity_id = r.id"""
+
+INVENTORY_SQL = """SELECT p.id, p.name, r.name as rarity_name, r.color, p.power_type,
+                          p.cooldown, p.damage, p.shield_duration, up.obtained_at, up.equipped_slot
+                   FROM user_powers up
+                   JOIN powers_new p ON up.power_id = p.id
+                   JOIN rarities r ON p.rarity_id = r.id
+                   WHERE up.user_id = %s
+                   ORDER BY up.equipped_slot NULLS LAST, up.obtained_at DESC"""
+
+# Balance is the users snapshot plus ledger entries not yet compacted into it
+USER_STATS_SQL = """SELECT u.money + COALESCE(SUM(l.money_delta), 0), u.spins + COALESCE(SUM(l.spins_delta), 0)
+                    FROM users u LEFT JOIN economy_ledger l ON l.user_id = u.id AND l.applied_at IS NULL
+                    WHERE u.id = %s GROUP BY u.id"""
+
+APPLY_PENDING_LEDGER_SQL = """WITH pending AS (
+                                 UPDATE economy_ledger SET applied_at = NOW()
+                                 WHERE user_id = %s AND applied_at IS NULL
+                                 RETURNING money_delta, spins_delta, wins_delta, losses_delta
+                             )
+                             UPDATE users SET money = money + (SELECT COALESCE(SUM(money_delta), 0) FROM pending),
+                                              spins = spins + (SELECT COALESCE(SUM(spins_delta), 0) FROM pending),
+                                              wins = wins + (SELECT COALESCE(SUM(wins_delta), 0) FROM pending),
+                                              losses = losses + (SELECT COALESCE(SUM(losses_delta), 0) FROM pending)
+                             WHERE id = %s AND EXISTS (SELECT 1 FROM pending)"""
+
+# Debit and grant in one statement: the spins >= count guard makes
+# concurrent spins unable to go negative, RETURNING reports duplicates
+SPIN_SQL = f"""WITH debit AS (
+                  UPDATE users SET spins = spins - %s WHERE id = %s AND spins >= %s RETURNING id, spins
+              ), granted AS (
+                  INSERT INTO user_powers (user_id, power_id)
+                  SELECT debit.id, drawn.power_id FROM debit, unnest(%s::int[]) AS drawn(power_id)
+                  ON CONFLICT DO NOTHING
+                  RETURNING power_id
+              ), audit AS (
+                  INSERT INTO economy_ledger (user_id, spins_delta, reason, applied_at)
+                  SELECT id, -%s, %s, NOW() FROM debit
+              ), daily AS (
+                  INSERT INTO stats_daily (day, shard, spins, new_powers)
+                  SELECT CURRENT_DATE, {STATS_SHARD}, %s, (SELECT COUNT(*) FROM granted) FROM debit
+                  ON CONFLICT (day, shard) DO UPDATE SET spins = stats_daily.spins + EXCLUDED.spins,
+                                                         new_powers = stats_daily.new_powers + EXCLUDED.new_powers
+              )
+              SELECT debit.spins, ARRAY(SELECT power_id FROM granted) FROM debit"""
+
+OWNED_POWER_SQL = "SELECT id FROM user_powers WHERE user_id = %s AND power_id = %s"
+CLEAR_SLOT_SQL = "UPDATE user_powers SET equipped_slot = NULL WHERE user_id = %s AND equipped_slot = %s"
+EQUIP_SQL = "UPDATE user_powers SET equipped_slot = %s WHERE user_id = %s AND power_id = %s"
+UNEQUIP_SQL = "UPDATE user_powers SET equipped_slot = NULL WHERE user_id = %s AND power_id = %s"
+
+EQUIP_STATS_SQL = f"""INSERT INTO power_stats (power_id, shard, equips) VALUES (%s, {STATS_SHARD}, 1)
+                     ON CONFLICT (power_id, shard) DO UPDATE SET equips = power_stats.equips + 1"""
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
     
     if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id',
-                'Access-Control-Max-Age': '86400'
-            },
-            'body': '',
-            'isBase64Encoded': False
-        }
+        return options_response('GET, POST, OPTIONS', 'Content-Type, X-User-Id, X-Idempotency-Key, X-Primary-Until')
+    
+    body_data: Dict[str, Any] = {}
+    if method == 'GET':
+        if (event.get('queryStringParameters') or {}).get('action') == 'throttle_stats':
+            return success_response({'success': True, **_throttle.stats()})
+    elif method == 'POST':
+        try:
+            body_data = json.loads(event.get('body') or '{}')
+        except ValueError:
+            return error_response('Invalid JSON body', 400)
+    
+    action = body_data.get('action')
+    user_id = body_data.get('user_id')
+    idempotency_key = body_data.get('idempotency_key') or get_header(event, 'X-Idempotency-Key')
+    
+    verdict, cached = _throttle.check(user_id, action, idempotency_key)
+    if verdict == 'duplicate':
+        return finalize_response(event, cached)
+    if verdict == 'limited':
+        return error_response('Too many requests', 429)
     
-    database_url = os.environ.get('DATABASE_URL')
-    conn = psycopg2.connect(database_url)
+    response = handle_request(event, method, body_data)
+    _throttle.remember(user_id, action, idempotency_key, response)
+    if method == 'POST' and response['statusCode'] < 400:
+        response = with_header(response, 'X-Primary-Until', primary_until())
+    return finalize_response(event, response)
+
+
+def handle_request(event: Dict[str, Any], method: str, body_data: Dict[str, Any]) -> Dict[str, Any]:
+    params = event.get('queryStringParameters') or {}
+    # Every GET here is a plain read and may go to the replica
+    conn = get_connection(read_only=method == 'GET', pinned_until=get_header(event, 'X-Primary-Until'))
     cur = conn.cursor()
     
     if method == 'GET':
-        params = event.get('queryStringParameters', {})
         action = params.get('action')
         user_id = params.get('user_id')
         
         if action == 'catalog':
-            cur.execute("""
-                SELECT p.id, p.name, r.name as rarity_name, p.power_type, p.cooldown, p.damage, p.shield_duration
-                FROM powers_new p
-                JOIN rarities r ON p.rarity_id = r.id
-                ORDER BY r.drop_chance ASC
-            """)
-            powers = cur.fetchall()
+            powers = cached_query(cur, 'catalog', CATALOG_SQL)
             cur.close()
-            conn.close()
+            release_connection(conn)
             
-            return {
-                'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({
-                    'powers': [
-                        {
-                            'id': p[0], 
-                            'name': p[1], 
-                            'rarity': p[2],
-                            'power_type': p[3],
-                            'cooldown': p[4],
-                            'damage': p[5],
-                            'shield_duration': p[6]
-                        }
-                        for p in powers
-                    ]
-                }),
-                'isBase64Encoded': False
-            }
+            return success_response({
+                'powers': [
+                    {
+                        'id': p[0], 
+                        'name': p[1], 
+                        'rarity': p[2],
+                        'power_type': p[3],
+                        'cooldown': p[4],
+                        'damage': p[5],
+                        'shield_duration': p[6]
+                    }
+                    for p in powers
+                ]
+            })
         
         elif action == 'inventory':
-            cur.execute(
-                """SELECT p.id, p.name, r.name as rarity_name, r.color, p.power_type, 
-                          p.cooldown, p.damage, p.shield_duration, up.obtained_at, up.equipped_slot
-                FROM user_powers up 
-                JOIN powers_new p ON up.power_id = p.id 
-                JOIN rarities r ON p.rarity_id = r.id
-                WHERE up.user_id = %s 
-                ORDER BY up.equipped_slot NULLS LAST, up.obtained_at DESC""",
-                (user_id,)
-            )
+            cur.execute(INVENTORY_SQL, (user_id,))
             inventory = cur.fetchall()
             cur.close()
-            conn.close()
+            release_connection(conn)
             
-            return {
-                'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({
-                    'inventory': [
-                        {
-                            'id': item[0],
-                            'name': item[1],
-                            'rarity': item[2],
-                            'rarity_color': item[3],
-                            'power_type': item[4],
-                            'cooldown': item[5],
-                            'damage': item[6],
-                            'shield_duration': item[7],
-                            'obtained_at': str(item[8]),
-                            'equipped_slot': item[9]
-                        }
-                        for item in inventory
-                    ]
-                }),
-                'isBase64Encoded': False
-            }
+            return success_response({
+                'inventory': [
+                    {
+                        'id': item[0],
+                        'name': item[1],
+                        'rarity': item[2],
+                        'rarity_color': item[3],
+                        'power_type': item[4],
+                        'cooldown': item[5],
+                        'damage': item[6],
+                        'shield_duration': item[7],
+                        'obtained_at': str(item[8]),
+                        'equipped_slot': item[9]
+                    }
+                    for item in inventory
+                ]
+            })
         
         elif action == 'user_stats':
-            cur.execute("SELECT money, spins FROM users WHERE id = %s", (user_id,))
+            cur.execute(USER_STATS_SQL, (user_id,))
             user = cur.fetchone()
             cur.close()
-            conn.close()
+            release_connection(conn)
             
             if not user:
-                return {
-                    'statusCode': 404,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'User not found'}),
-                    'isBase64Encoded': False
-                }
+                return error_response('User not found', 404)
             
-            return {
-                'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'money': user[0], 'spins': user[1]}),
-                'isBase64Encoded': False
-            }
+            return success_response({'money': user[0], 'spins': user[1]})
     
     if method != 'POST':
         cur.close()
-        conn.close()
-        return {
-            'statusCode': 405,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Method not allowed'}),
-            'isBase64Encoded': False
-        }
+        release_connection(conn)
+        return error_response('Method not allowed', 405)
     
-    body_data = json.loads(event.get('body', '{}'))
     action = body_data.get('action')
     user_id = body_data.get('user_id')
     
-    if action == 'spin':
-        cur.execute("SELECT spins FROM users WHERE id = %s", (user_id,))
-        user = cur.fetchone()
-        
-        if not user or user[0] < 1:
-            cur.close()
-            conn.close()
-            return {
-                'statusCode': 400,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'Not enough spins'}),
-                'isBase64Encoded': False
-            }
+    if action == 'spin' or action == 'spin_many':
+        count = 1
+        if action == 'spin_many':
+            try:
+                count = int(body_data.get('count', 0))
+            except (TypeError, ValueError):
+                count = 0
+            if count < 1 or count > SPIN_MANY_MAX:
+                cur.close()
+                release_connection(conn)
+                return error_response(f'count must be between 1 and {SPIN_MANY_MAX}', 400)
         
-        cur.execute("""
-            SELECT p.id, p.name, r.name as rarity_name, r.color, r.drop_chance
-            FROM powers_new p
-            JOIN rarities r ON p.rarity_id = r.id
-        """)
-        all_powers = cur.fetchall()
+        all_powers = cached_query(cur, 'spin_pool', SPIN_POOL_SQL)
         
         if not all_powers:
             cur.close()
-            conn.close()
-            return {
-                'statusCode': 400,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'No powers available in the game yet'}),
-                'isBase64Encoded': False
-            }
+            release_connection(conn)
+            return error_response('No powers available in the game yet', 400)
         
-        rand_num = random.uniform(0, 100)
-        cumulative = 0
-        selected_power = None
+        drawn = [pick_power(all_powers) for _ in range(count)]
         
-        for power in all_powers:
-            cumulative += float(power[4])
-            if rand_num <= cumulative:
-                selected_power = power
-                break
-        
-        if not selected_power:
-            selected_power = all_powers[0]
-        
-        cur.execute("UPDATE users SET spins = spins - 1 WHERE id = %s", (user_id,))
-        
-        cur.execute(
-            "INSERT INTO user_powers (user_id, power_id) VALUES (%s, %s) ON CONFLICT DO NOTHING",
-            (user_id, selected_power[0])
-        )
+        # Spins won in battles may still be pending in the ledger
+        cur.execute(APPLY_PENDING_LEDGER_SQL, (user_id, user_id))
         
+        cur.execute(SPIN_SQL, (count, user_id, count, list({power[0] for power in drawn}), count, action, count))
+        result = cur.fetchone()
         conn.commit()
         cur.close()
-        conn.close()
+        release_connection(conn)
         
-        return {
-            'statusCode': 200,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({
+        if not result:
+            return error_response('Not enough spins', 400)
+        
+        spins_left, new_power_ids = result[0], set(result[1])
+        powers = []
+        for power in drawn:
+            powers.append({
+                'id': power[0],
+                'name': power[1],
+                'rarity': power[2],
+                'color': power[3],
+                'duplicate': power[0] not in new_power_ids
+            })
+            new_power_ids.discard(power[0])
+        
+        if action == 'spin':
+            body = {'success': True, 'power': powers[0], 'duplicate': powers[0]['duplicate'], 'spins': spins_left}
+        else:
+            duplicates = sum(1 for power in powers if power['duplicate'])
+            body = {
                 'success': True,
-                'power': {
-                    'id': selected_power[0],
-                    'name': selected_power[1],
-                    'rarity': selected_power[2],
-                    'color': selected_power[3]
-                }
-            }),
-            'isBase64Encoded': False
-        }
+                'powers': powers,
+                'new_powers': count - duplicates,
+                'duplicates': duplicates,
+                'spins': spins_left
+            }
+        
+        return success_response(body)
     
     if action == 'equip_power':
         power_id = body_data.get('power_id')
@@ -215,73 +265,61 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         
         if not slot or slot < 1 or slot > 3:
             cur.close()
-            conn.close()
-            return {
-                'statusCode': 400,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'Invalid slot (must be 1-3)'}),
-                'isBase64Encoded': False
-            }
+            release_connection(conn)
+            return error_response('Invalid slot (must be 1-3)', 400)
         
-        cur.execute(
-            "SELECT id FROM user_powers WHERE user_id = %s AND power_id = %s",
-            (user_id, power_id)
-        )
+        cur.execute(OWNED_POWER_SQL, (user_id, power_id))
         if not cur.fetchone():
             cur.close()
-            conn.close()
-            return {
-                'statusCode': 404,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'Power not found in inventory'}),
-                'isBase64Encoded': False
-            }
+            release_connection(conn)
+            return error_response('Power not found in inventory', 404)
         
-        cur.execute(
-            "UPDATE user_powers SET equipped_slot = NULL WHERE user_id = %s AND equipped_slot = %s",
-            (user_id, slot)
-        )
-        
-        cur.execute(
-            "UPDATE user_powers SET equipped_slot = %s WHERE user_id = %s AND power_id = %s",
-            (slot, user_id, power_id)
-        )
+        cur.execute(CLEAR_SLOT_SQL, (user_id, slot))
+        cur.execute(EQUIP_SQL, (slot, user_id, power_id))
+        cur.execute(EQUIP_STATS_SQL, (power_id,))
         
         conn.commit()
         cur.close()
-        conn.close()
+        release_connection(conn)
         
-        return {
-            'statusCode': 200,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'success': True}),
-            'isBase64Encoded': False
-        }
+        return success_response({'success': True})
     
     if action == 'unequip_power':
         power_id = body_data.get('power_id')
         
-        cur.execute(
-            "UPDATE user_powers SET equipped_slot = NULL WHERE user_id = %s AND power_id = %s",
-            (user_id, power_id)
-        )
+        cur.execute(UNEQUIP_SQL, (user_id, power_id))
         
         conn.commit()
         cur.close()
-        conn.close()
+        release_connection(conn)
         
-        return {
-            'statusCode': 200,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'success': True}),
-            'isBase64Encoded': False
-        }
+        return success_response({'success': True})
     
     cur.close()
-    conn.close()
-    return {
-        'statusCode': 400,
-        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-        'body': json.dumps({'error': 'Invalid action'}),
-        'isBase64Encoded': False
-    }
\ No newline at end of file
+    release_connection(conn)
+    return error_response('Invalid action', 400)
+
+
+def cached_query(cur, key: str, sql: str) -> List[Tuple]:
+    cached = _catalog_cache.get(key)
+    if cached and cached[0] > time.monotonic():
+        return cached[1]
+    
+    cur.execute(sql)
+    rows = cur.fetchall()
+    if rows:
+        _catalog_cache[key] = (time.monotonic() + CATALOG_TTL_SECONDS, rows)
+    return rows
+
+
+def pick_power(all_powers: List[Tuple]) -> Tuple:
+    '''Roll uniform(0, 100) against the cumulative drop chances, falling back to the first power'''
+    rand_num = random.uniform(0, 100)
+    cumulative = 0
+    
+    for power in all_powers:
+        cumulative += float(power[4])
+        if rand_num <= cumulative:
+            return power
+    
+    return all_powers[0]
\ No newline at end of file
@@ -0,0 +1,12 @@
+-- check_match looks up the active battle of a player from either side: (player1_id = X OR player2_id = X) AND status = 'active'
+-- Two partial indexes let the planner combine both sides with a BitmapOr and only ever hold active battles
+CREATE INDEX IF NOT EXISTS idx_battles_active_player1 ON battles(player1_id) WHERE status = 'active';
+CREATE INDEX IF NOT EXISTS idx_battles_active_player2 ON battles(player2_id) WHERE status = 'active';
+
+-- Nothing filters battles by status alone, the partial indexes above cover the active lookups
+DROP INDEX IF EXISTS idx_battles_status;
+
+-- matchmaking_queue.status is never read or written by the game, queue access goes by joined_at and user_id
+DROP INDEX IF EXISTS idx_matchmaking_status;
+CREATE INDEX IF NOT EXISTS idx_matchmaking_joined ON matchmaking_queue(joined_at);
+CREATE INDEX IF NOT EXISTS idx_matchmaking_user ON matchmaking_queue(user_id);
@@ -0,0 +1,4 @@
+-- Append-only log of every accepted battle action, packed as fixed 18-byte records (see backend/game/battle_log.py)
+ALTER TABLE battles ADD COLUMN IF NOT EXISTS action_log BYTEA NOT NULL DEFAULT ''::bytea;
+
+COMMENT ON COLUMN battles.action_log IS 'Packed action records: ts_ms, player slot, kind, power_id, amount, cooldown';
@@ -0,0 +1,7 @@
+-- button_expires_at now holds the idle deadline of a battle and current_turn the slot (1/2) of the player who acted last
+UPDATE battles SET button_expires_at = created_at + INTERVAL '60 seconds' WHERE status = 'active' AND button_expires_at IS NULL;
+
+CREATE INDEX IF NOT EXISTS idx_battles_active_deadline ON battles(button_expires_at) WHERE status = 'active';
+
+COMMENT ON COLUMN battles.button_expires_at IS 'Idle deadline, the battle is finished by timeout once it passes';
+COMMENT ON COLUMN battles.current_turn IS 'Slot (1 or 2) of the player who acted last, wins the battle on timeout';
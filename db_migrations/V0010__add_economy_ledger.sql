@@ -0,0 +1,17 @@
+-- Append-only record of every money/spins change; entries with applied_at IS NULL are credits
+-- not yet folded into users.money/users.spins, balances read as users + pending entries
+CREATE TABLE IF NOT EXISTS economy_ledger (
+    id BIGSERIAL PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES users(id),
+    money_delta INTEGER NOT NULL DEFAULT 0,
+    spins_delta INTEGER NOT NULL DEFAULT 0,
+    reason VARCHAR(32) NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    applied_at TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_economy_ledger_pending ON economy_ledger(user_id) WHERE applied_at IS NULL;
+CREATE INDEX IF NOT EXISTS idx_economy_ledger_user ON economy_ledger(user_id, created_at);
+
+COMMENT ON COLUMN economy_ledger.reason IS 'cancel_search, battle_win, buy_slot, admin_give, spin or spin_many';
+COMMENT ON COLUMN economy_ledger.applied_at IS 'When the entry was folded into users, NULL while pending';
@@ -0,0 +1,54 @@
+-- Pre-aggregated counters for the admin analytics endpoints. They are updated in the
+-- same transaction as the spin, equip and battle start/end writes, so dashboards
+-- read these small tables instead of scanning users, user_powers and battles.
+-- Writers pick a random shard so concurrent transactions do not queue on one
+-- counter row; readers sum the shards
+CREATE TABLE IF NOT EXISTS stats_daily (
+    day DATE NOT NULL,
+    shard SMALLINT NOT NULL DEFAULT 0,
+    spins INTEGER NOT NULL DEFAULT 0,
+    new_powers INTEGER NOT NULL DEFAULT 0,
+    battles_started INTEGER NOT NULL DEFAULT 0,
+    battles_finished INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, shard)
+);
+
+CREATE TABLE IF NOT EXISTS power_stats (
+    power_id INTEGER NOT NULL,
+    shard SMALLINT NOT NULL DEFAULT 0,
+    battles INTEGER NOT NULL DEFAULT 0,
+    wins INTEGER NOT NULL DEFAULT 0,
+    equips INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (power_id, shard)
+);
+
+-- Backfill what the existing tables can tell, into shard 0. Battle totals must be
+-- complete: active battles are read as started minus finished over all days.
+-- Battles started or finished by a game function older than this migration are
+-- not counted; run the admin_recount_battle_stats action after deploying it
+INSERT INTO stats_daily (day, battles_started)
+SELECT created_at::date, COUNT(*) FROM battles GROUP BY created_at::date
+ON CONFLICT (day, shard) DO UPDATE SET battles_started = EXCLUDED.battles_started;
+
+INSERT INTO stats_daily (day, battles_finished)
+SELECT COALESCE(finished_at, created_at)::date, COUNT(*) FROM battles WHERE status != 'active'
+GROUP BY COALESCE(finished_at, created_at)::date
+ON CONFLICT (day, shard) DO UPDATE SET battles_finished = EXCLUDED.battles_finished;
+
+INSERT INTO stats_daily (day, new_powers)
+SELECT obtained_at::date, COUNT(*) FROM user_powers GROUP BY obtained_at::date
+ON CONFLICT (day, shard) DO UPDATE SET new_powers = EXCLUDED.new_powers;
+
+INSERT INTO stats_daily (day, spins)
+SELECT created_at::date, -SUM(spins_delta) FROM economy_ledger
+WHERE reason IN ('spin', 'spin_many') GROUP BY created_at::date
+ON CONFLICT (day, shard) DO UPDATE SET spins = EXCLUDED.spins;
+
+INSERT INTO power_stats (power_id, equips)
+SELECT power_id, COUNT(*) FROM user_powers WHERE equipped_slot IS NOT NULL GROUP BY power_id
+ON CONFLICT (power_id, shard) DO NOTHING;
+
+COMMENT ON COLUMN stats_daily.spins IS 'Spins spent; before the economy ledger existed spins were not recorded';
+COMMENT ON COLUMN power_stats.battles IS 'Finished battles per side that had the power equipped when the battle ended';
+COMMENT ON COLUMN power_stats.wins IS 'Of power_stats.battles, the ones that side won';
+COMMENT ON COLUMN power_stats.equips IS 'equip_power calls; backfilled with the powers equipped at migration time';
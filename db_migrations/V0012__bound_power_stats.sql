@@ -0,0 +1,12 @@
+-- Battle action records store a power's damage or shield duration and its cooldown as
+-- unsigned 16-bit fields (see backend/game/battle_log.py). Larger values already act
+-- as "kills in one hit" or "never again" within a battle, so clamping keeps behaviour
+UPDATE powers_new SET cooldown = LEAST(GREATEST(cooldown, 0), 65535),
+                      damage = LEAST(GREATEST(damage, 0), 65535),
+                      shield_duration = LEAST(GREATEST(shield_duration, 0), 65535)
+WHERE cooldown NOT BETWEEN 0 AND 65535
+   OR damage NOT BETWEEN 0 AND 65535
+   OR shield_duration NOT BETWEEN 0 AND 65535;
+
+ALTER TABLE powers_new ADD CONSTRAINT powers_new_stats_fit_action_log
+    CHECK (cooldown BETWEEN 0 AND 65535 AND damage BETWEEN 0 AND 65535 AND shield_duration BETWEEN 0 AND 65535);
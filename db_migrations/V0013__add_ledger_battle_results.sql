@@ -0,0 +1,7 @@
+-- Battle results join money and spins in the ledger: ending a battle appends entries
+-- instead of updating both players' users rows, and compaction folds the counts into
+-- users.wins/users.losses like balances. Pending entries count towards the record shown
+ALTER TABLE economy_ledger ADD COLUMN IF NOT EXISTS wins_delta INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE economy_ledger ADD COLUMN IF NOT EXISTS losses_delta INTEGER NOT NULL DEFAULT 0;
+
+COMMENT ON COLUMN economy_ledger.reason IS 'cancel_search, battle_win, battle_loss, buy_slot, admin_give, spin or spin_many';
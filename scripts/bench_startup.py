@@ -0,0 +1,130 @@
+'''
+Business: Measure cold-start import time and first/second request latency of each backend function
+Args: --runs per function, --history JSONL file to append results to, optional function names
+Returns: table on stdout; one JSON line per function appended to the history file
+
+Every run starts a fresh interpreter so module-level initialization is measured
+as a cold start. Requests are read-only probes (PROBES), so repeated runs hit the
+same code path and stay comparable; they need DATABASE_URL to reach a real
+database. The history file is local and ignored by git.
+'''
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, Any, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BACKEND = os.path.join(ROOT, 'backend')
+
+# One request per function that reads but never writes. The game probe is a
+# replica action (REPLICA_GET_ACTIONS), which never runs the expiry sweep or
+# ledger compaction that other game requests piggyback
+PROBES: Dict[str, Dict[str, Any]] = {
+    'game': {'method': 'GET', 'path': '/?action=get_user_slots&user_id=1'},
+    'powers': {'method': 'GET', 'path': '/?action=catalog'},
+    # Login of a nick that cannot be registered (too long for users.nick) always takes the same failing path
+    'auth': {'method': 'POST', 'path': '/', 'body': {'action': 'login', 'nick': 'bench_' + 'x' * 60, 'password': 'x'}},
+}
+
+PROBE = '''
+import json, sys, time
+from urllib.parse import urlsplit, parse_qsl
+
+case = json.loads(sys.argv[1])
+query = dict(parse_qsl(urlsplit(case.get('path', '/')).query))
+event = {
+    'httpMethod': case.get('method', 'GET'),
+    'queryStringParameters': query or None,
+    'headers': {},
+    'body': json.dumps(case['body']) if 'body' in case else '',
+}
+
+started = time.perf_counter()
+import index
+imported = time.perf_counter()
+first = index.handler(dict(event), None)
+first_done = time.perf_counter()
+index.handler(dict(event), None)
+second_done = time.perf_counter()
+
+print(json.dumps({
+    'import_ms': (imported - started) * 1000,
+    'first_request_ms': (first_done - imported) * 1000,
+    'second_request_ms': (second_done - first_done) * 1000,
+    'status': first.get('statusCode'),
+}))
+'''
+
+
+def list_functions() -> List[str]:
+    return sorted(
+        name for name in os.listdir(BACKEND)
+        if os.path.isfile(os.path.join(BACKEND, name, 'index.py'))
+    )
+
+
+def probe_case(function: str) -> Dict[str, Any]:
+    # Functions without a known read-only request only measure the CORS preflight
+    return PROBES.get(function, {'method': 'OPTIONS', 'path': '/'})
+
+
+def measure(function: str, runs: int) -> Dict[str, Any]:
+    case = json.dumps(probe_case(function))
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        proc = subprocess.run(
+            [sys.executable, '-c', PROBE, case],
+            cwd=os.path.join(BACKEND, function),
+            capture_output=True, text=True
+        )
+        total_ms = (time.perf_counter() - started) * 1000
+        if proc.returncode != 0:
+            return {'function': function, 'error': proc.stderr.strip().splitlines()[-1:]}
+        sample = json.loads(proc.stdout.strip().splitlines()[-1])
+        sample['process_ms'] = total_ms
+        samples.append(sample)
+
+    result: Dict[str, Any] = {'function': function, 'runs': runs, 'status': samples[0]['status']}
+    for key in ('import_ms', 'first_request_ms', 'second_request_ms', 'process_ms'):
+        result[key] = round(statistics.median(s[key] for s in samples), 2)
+    return result
+
+
+def git_revision() -> str:
+    proc = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True)
+    return proc.stdout.strip()
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description='Benchmark cold start of the backend functions')
+    parser.add_argument('functions', nargs='*', help='function names, defaults to all of backend/')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--history', default=os.path.join(ROOT, 'bench_startup.jsonl'))
+    args = parser.parse_args(argv)
+
+    revision = git_revision()
+    recorded_at = time.strftime('%Y-%m-%dT%H:%M:%S')
+    results = [measure(name, args.runs) for name in args.functions or list_functions()]
+
+    print(f"{'function':<10} {'import':>9} {'first req':>10} {'second req':>11} {'process':>9}  status")
+    for r in results:
+        if 'error' in r:
+            print(f"{r['function']:<10} failed: {' '.join(r['error'])}")
+            continue
+        print(f"{r['function']:<10} {r['import_ms']:>7.1f}ms {r['first_request_ms']:>8.1f}ms "
+              f"{r['second_request_ms']:>9.1f}ms {r['process_ms']:>7.1f}ms  {r['status']}")
+
+    with open(args.history, 'a') as f:
+        for r in results:
+            f.write(json.dumps({'recorded_at': recorded_at, 'revision': revision, **r}) + '\n')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
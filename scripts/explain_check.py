@@ -0,0 +1,204 @@
+'''
+Business: Plan regression check for the hot queries of the backend functions
+Args: DATABASE_URL of a database with the game schema, --users scale of the seeded data
+Returns: plan summary per query on stdout; exit code 1 when a query scans a large table sequentially
+
+Seeds users, battles, inventories and ledger entries at scale inside one
+transaction, runs EXPLAIN on the statement constants the game, powers and auth
+handlers execute (imported from their index modules, so the check cannot drift
+from the code) and rolls everything back, so the database is left as it was. Point it at a
+staging copy rather than production: the seeding holds locks until rollback.
+'''
+
+import argparse
+import importlib
+import json
+import os
+import sys
+import uuid
+from typing import Dict, Any, List, Iterator, Tuple
+
+import psycopg2
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BACKEND = os.path.join(ROOT, 'backend')
+FUNCTIONS = ('game', 'powers', 'auth')
+
+# Tables that grow with players and battles; a sequential scan of one of them
+# on a request path is a regression. Catalog and rollup tables stay small.
+LARGE_TABLES = {'users', 'battles', 'user_powers', 'economy_ledger', 'battle_cooldowns'}
+
+SEED_SQL = [
+    """INSERT INTO rarities (name, drop_chance, color)
+       SELECT 'explain_rarity', 10, '#ffffff' WHERE NOT EXISTS (SELECT 1 FROM rarities)""",
+    """INSERT INTO powers_new (name, rarity_id, power_type, cooldown, damage, shield_duration)
+       SELECT 'explain_power_' || i, (SELECT MIN(id) FROM rarities),
+              (ARRAY['attack', 'defense', 'counter'])[1 + i %% 3], 5, 10, 2
+       FROM generate_series(1, 20) i""",
+    """INSERT INTO users (nick, password, money, spins)
+       SELECT %(prefix)s || i, 'x', 1000, 10 FROM generate_series(1, %(users)s) i""",
+    """CREATE TEMP TABLE explain_users ON COMMIT DROP AS
+       SELECT id, row_number() OVER (ORDER BY id) - 1 AS n FROM users WHERE starts_with(nick, %(prefix)s)""",
+    """INSERT INTO battles (player1_id, player2_id, player1_hp, player2_hp, status, current_turn,
+                           button_expires_at, winner_id, created_at, finished_at)
+       SELECT p1.id, p2.id, CASE WHEN i %% 100 = 0 THEN 60 ELSE 0 END, 50,
+              CASE WHEN i %% 100 = 0 THEN 'active' ELSE 'finished' END, 1,
+              NOW() + (60 - i %% 120) * INTERVAL '1 second',
+              CASE WHEN i %% 100 = 0 THEN NULL ELSE p2.id END,
+              NOW() - i * INTERVAL '1 second',
+              CASE WHEN i %% 100 = 0 THEN NULL ELSE NOW() - i * INTERVAL '1 second' END
+       FROM generate_series(1, %(users)s * 2) i
+       JOIN explain_users p1 ON p1.n = i %% %(users)s
+       JOIN explain_users p2 ON p2.n = (i * 7919 + 1) %% %(users)s""",
+    """INSERT INTO user_powers (user_id, power_id, equipped_slot)
+       SELECT u.id, p.id, CASE WHEN p.slot <= 3 THEN p.slot END
+       FROM explain_users u,
+            (SELECT id, row_number() OVER (ORDER BY id) AS slot FROM powers_new ORDER BY id LIMIT 5) p
+       ON CONFLICT DO NOTHING""",
+    """INSERT INTO economy_ledger (user_id, money_delta, spins_delta, reason, created_at, applied_at)
+       SELECT u.id, 100, 1, 'battle_win', NOW() - k * INTERVAL '1 hour',
+              CASE WHEN k = 0 AND u.n %% 10 = 0 THEN NULL ELSE NOW() END
+       FROM explain_users u, generate_series(0, 3) k""",
+    """INSERT INTO matchmaking_queue (user_id, joined_at)
+       SELECT id, NOW() - n * INTERVAL '100 milliseconds' FROM explain_users WHERE n < 200""",
+    """INSERT INTO battle_cooldowns (battle_id, user_id, power_id, can_use_at)
+       SELECT b.id, b.player1_id, (SELECT MIN(id) FROM powers_new), 0
+       FROM battles b JOIN explain_users u ON u.id = b.player1_id WHERE b.status = 'active'
+       ON CONFLICT DO NOTHING""",
+    "ANALYZE users",
+    "ANALYZE battles",
+    "ANALYZE user_powers",
+    "ANALYZE economy_ledger",
+    "ANALYZE matchmaking_queue",
+    "ANALYZE battle_cooldowns",
+]
+
+SAMPLE_SQL = """
+    SELECT b.id AS battle_id, b.player1_id AS user_id, b.player2_id AS opponent_id, u.nick,
+           (SELECT MIN(id) FROM powers_new) AS power_id,
+           ARRAY(SELECT MIN(id) FROM powers_new) AS power_ids,
+           ARRAY(SELECT id FROM economy_ledger WHERE applied_at IS NULL ORDER BY id LIMIT 500) AS ledger_ids,
+           ARRAY(SELECT id FROM explain_users ORDER BY id LIMIT 100) AS user_ids
+    FROM battles b JOIN users u ON u.id = b.player1_id JOIN explain_users e ON e.id = u.id
+    WHERE b.status = 'active' LIMIT 1
+"""
+
+# Values of the parameters that do not come from the seeded rows
+CONSTANTS: Dict[str, Any] = {
+    'none': None, 'seconds': 60, 'limit': 500, 'amount': 100, 'count': 1, 'slot': 1,
+    'reason': 'spin', 'password': 'x', 'ms': 0,
+}
+
+# (function, statement constant of its index module, sample values for its %s
+# placeholders in order); {slot_column} templates are planned for slot 2
+QUERIES: List[Tuple[str, str, Tuple[str, ...]]] = [
+    ('game', 'CHECK_MATCH_SQL', ('user_id', 'user_id')),
+    ('game', 'BATTLE_STATE_SQL', ('battle_id',)),
+    ('game', 'BATTLE_REPLAY_SQL', ('battle_id',)),
+    ('game', 'USER_POWERS_SQL', ('user_id',)),
+    ('game', 'USER_SLOTS_SQL', ('user_id',)),
+    ('game', 'QUEUE_EXPIRE_SQL', ()),
+    ('game', 'QUEUE_OPPONENT_SQL', ('user_id',)),
+    ('game', 'QUEUE_JOIN_SQL', ('user_id',)),
+    ('game', 'QUEUE_LEAVE_SQL', ('user_id', 'opponent_id')),
+    ('game', 'START_BATTLE_SQL', ('user_id', 'opponent_id', 'seconds')),
+    ('game', 'CANCEL_SEARCH_REWARD_SQL', ('amount', 'user_id')),
+    ('game', 'BUY_SLOT_USER_SQL', ('user_id',)),
+    ('game', 'BUY_SLOT_DEBIT_SQL', ('amount', 'user_id', 'amount', 'amount')),
+    ('game', 'ATTACK_BATTLE_SQL', ('battle_id',)),
+    ('game', 'ATTACK_BATCH_BATTLE_SQL', ('battle_id',)),
+    ('game', 'POWER_USE_BATTLE_SQL', ('battle_id',)),
+    ('game', 'POWER_COOLDOWN_SQL', ('battle_id', 'user_id', 'power_id')),
+    ('game', 'SET_POWER_COOLDOWN_SQL', ('battle_id', 'user_id', 'power_id', 'ms', 'ms')),
+    ('game', 'BATTLE_RESULT_SQL', ('user_id', 'amount', 'count', 'opponent_id')),
+    ('game', 'FINISH_BATTLE_SQL', ('user_id', 'battle_id')),
+    ('game', 'BALANCE_SQL', ('user_id',)),
+    ('game', 'APPLY_PENDING_LEDGER_SQL', ('user_id', 'user_id')),
+    ('game', 'LEDGER_CLAIM_SQL', ('limit',)),
+    ('game', 'LEDGER_LOCK_USERS_SQL', ('user_ids',)),
+    ('game', 'LEDGER_APPLY_SQL', ('ledger_ids',)),
+    ('game', 'EXPIRE_BATTLES_SQL', ('seconds', 'none', 'none', 'limit', 'amount', 'count')),
+    ('powers', 'CATALOG_SQL', ()),
+    ('powers', 'SPIN_POOL_SQL', ()),
+    ('powers', 'INVENTORY_SQL', ('user_id',)),
+    ('powers', 'USER_STATS_SQL', ('user_id',)),
+    ('powers', 'APPLY_PENDING_LEDGER_SQL', ('user_id', 'user_id')),
+    ('powers', 'SPIN_SQL', ('count', 'user_id', 'count', 'power_ids', 'count', 'reason', 'count')),
+    ('powers', 'OWNED_POWER_SQL', ('user_id', 'power_id')),
+    ('powers', 'CLEAR_SLOT_SQL', ('user_id', 'slot')),
+    ('powers', 'EQUIP_SQL', ('slot', 'user_id', 'power_id')),
+    ('powers', 'UNEQUIP_SQL', ('user_id', 'power_id')),
+    ('powers', 'EQUIP_STATS_SQL', ('power_id',)),
+    ('auth', 'NICK_TAKEN_SQL', ('nick',)),
+    ('auth', 'REGISTER_SQL', ('nick', 'password')),
+    ('auth', 'LOGIN_SQL', ('nick', 'password')),
+]
+
+
+def load_handlers() -> Dict[str, Any]:
+    '''Import the index module of each function; they share module names, so each gets a clean import'''
+    local_modules = {name[:-3] for function in FUNCTIONS
+                     for name in os.listdir(os.path.join(BACKEND, function)) if name.endswith('.py')}
+    handlers = {}
+    for function in FUNCTIONS:
+        for name in local_modules:
+            sys.modules.pop(name, None)
+        sys.path.insert(0, os.path.join(BACKEND, function))
+        try:
+            handlers[function] = importlib.import_module('index')
+        finally:
+            sys.path.pop(0)
+    return handlers
+
+
+def plan_nodes(plan: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    yield plan
+    for child in plan.get('Plans', []):
+        yield from plan_nodes(child)
+
+
+def explain(cur, sql: str, params: Tuple[Any, ...]) -> Dict[str, Any]:
+    cur.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+    result = cur.fetchone()[0]
+    return (json.loads(result) if isinstance(result, str) else result)[0]['Plan']
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description='Fail when a hot query plans a sequential scan of a large table')
+    parser.add_argument('--users', type=int, default=100000, help='seeded users; battles are twice as many')
+    args = parser.parse_args(argv)
+
+    handlers = load_handlers()
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    cur = conn.cursor()
+    failures = 0
+    try:
+        seed_params = {'users': args.users, 'prefix': f'explain_{uuid.uuid4().hex[:8]}_'}
+        for sql in SEED_SQL:
+            cur.execute(sql, seed_params)
+
+        cur.execute(SAMPLE_SQL)
+        columns = [column[0] for column in cur.description]
+        params = dict(zip(columns, cur.fetchone()))
+
+        params.update(CONSTANTS)
+        for function, constant, names in QUERIES:
+            sql = getattr(handlers[function], constant).replace('{slot_column}', 'slot2_unlocked')
+            nodes = list(plan_nodes(explain(cur, sql, tuple(params[name] for name in names))))
+            seq_scans = sorted({node['Relation Name'] for node in nodes
+                                if node['Node Type'] == 'Seq Scan' and node.get('Relation Name') in LARGE_TABLES})
+            indexes = sorted({node['Index Name'] for node in nodes if 'Index Name' in node})
+            status = 'FAIL' if seq_scans else 'ok'
+            detail = f"seq scan on {', '.join(seq_scans)}" if seq_scans else ', '.join(indexes) or 'no index needed'
+            print(f'{status:<4} {function:<6} {constant:<26} {detail}')
+            failures += bool(seq_scans)
+    finally:
+        conn.rollback()
+        cur.close()
+        conn.close()
+
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
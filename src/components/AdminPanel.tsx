@@ -1,4 +1,5 @@
 import { useState, useEffect } from 'react';
+import { apiFetch } from '@/lib/api';
 import { Button } from '@/components/ui/button';
 import { Card } from '@/components/ui/card';
 import { Input } from '@/components/ui/input';
@@ -72,7 +73,7 @@ export default function AdminPanel({ apiUrl, onBack, currentUser, updateUser }:
 
   const fetchRarities = async () => {
     try {
-      const response = await fetch(`${apiUrl}?action=admin_get_rarities`);
+      const response = await apiFetch(`${apiUrl}?action=admin_get_rarities`);
       const data = await response.json();
       console.log('Rarities response:', data);
       if (data.success) {
@@ -88,7 +89,7 @@ export default function AdminPanel({ apiUrl, onBack, currentUser, updateUser }:
 
   const fetchPowers = async () => {
     try {
-      const response = await fetch(`${apiUrl}?action=admin_get_powers`);
+      const response = await apiFetch(`${apiUrl}?action=admin_get_powers`);
       const data = await response.json();
       if (data.success) {
         setPowers(data.powers || []);
@@ -103,7 +104,7 @@ export default function AdminPanel({ apiUrl, onBack, currentUser, updateUser }:
     setLoading(true);
 
     try {
-      const response = await fetch(apiUrl, {
+      const response = await apiFetch(apiUrl, {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify({
@@ -142,7 +143,7 @@ export default function AdminPanel({ apiUrl, onBack, currentUser, updateUser }:
     if (!confirm('Delete this power?')) return;
 
     try {
-      const response = await fetch(apiUrl, {
+      const response = await apiFetch(apiUrl, {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify({
@@ -169,7 +170,7 @@ export default function AdminPanel({ apiUrl, onBack, currentUser, updateUser }:
     setLoading(true);
 
     try {
-      const response = await fetch(apiUrl, {
+      const response = await apiFetch(apiUrl, {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify({
@@ -199,7 +200,7 @@ export default function AdminPanel({ apiUrl, onBack, currentUser, updateUser }:
     if (!confirm('Delete this rarity? All powers with this rarity will also be deleted!')) return;
 
     try {
-      const response = await fetch(apiUrl, {
+      const response = await apiFetch(apiUrl, {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify({
@@ -227,7 +228,7 @@ export default function AdminPanel({ apiUrl, onBack, currentUser, updateUser }:
     setLoading(true);
 
     try {
-      const response = await fetch(apiUrl, {
+      const response = await apiFetch(apiUrl, {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify({
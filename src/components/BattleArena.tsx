@@ -1,4 +1,5 @@
 import { useEffect, useState } from 'react';
+import { apiFetch } from '@/lib/api';
 import { Button } from '@/components/ui/button';
 import { Card } from '@/components/ui/card';
 import { Progress } from '@/components/ui/progress';
@@ -33,7 +34,7 @@ interface BattleState {
   player1_counter_until: number;
   player2_counter_until: number;
   status: string;
-  winner_id?: number;
+  winner_id?: number | null;
 }
 
 export default function BattleArena({ battleId, userId, opponentId, apiUrl, onBattleEnd, updateUser }: BattleArenaProps) {
@@ -50,6 +51,8 @@ export default function BattleArena({ battleId, userId, opponentId, apiUrl, onBa
   const [showButton, setShowButton] = useState(false);
   const [buttonClicked, setButtonClicked] = useState(false);
   const [winner, setWinner] = useState<number | null>(null);
+  // Set when the server finished the battle for inactivity before anyone acted
+  const [timedOut, setTimedOut] = useState(false);
   const [powers, setPowers] = useState<Power[]>([]);
   const [cooldowns, setCooldowns] = useState<Record<number, number>>({});
 
@@ -70,7 +73,7 @@ export default function BattleArena({ battleId, userId, opponentId, apiUrl, onBa
   useEffect(() => {
     const fetchPowers = async () => {
       try {
-        const response = await fetch(`${apiUrl}?action=get_user_powers&user_id=${userId}`);
+        const response = await apiFetch(`${apiUrl}?action=get_user_powers&user_id=${userId}`);
         const data = await response.json();
         if (data.success) {
           setPowers(data.powers || []);
@@ -86,7 +89,7 @@ export default function BattleArena({ battleId, userId, opponentId, apiUrl, onBa
   useEffect(() => {
     const checkBattleState = setInterval(async () => {
       try {
-        const response = await fetch(`${apiUrl}?action=battle_state&battle_id=${battleId}`);
+        const response = await apiFetch(`${apiUrl}?action=battle_state&battle_id=${battleId}`);
         const data = await response.json();
         
         setBattleState(data);
@@ -101,6 +104,12 @@ export default function BattleArena({ battleId, userId, opponentId, apiUrl, onBa
             toast.error('Defeat! Better luck next time');
           }
 
+          setTimeout(onBattleEnd, 3000);
+        } else if (data.status === 'finished') {
+          setTimedOut(true);
+          clearInterval(checkBattleState);
+          toast.info('Battle timed out with no winner');
+
           setTimeout(onBattleEnd, 3000);
         }
       } catch (error) {
@@ -112,7 +121,7 @@ export default function BattleArena({ battleId, userId, opponentId, apiUrl, onBa
   }, [battleId, apiUrl, userId, onBattleEnd]);
 
   useEffect(() => {
-    if (winner) return;
+    if (winner || timedOut) return;
 
     const showButtonInterval = setInterval(() => {
       setShowButton(true);
@@ -124,7 +133,7 @@ export default function BattleArena({ battleId, userId, opponentId, apiUrl, onBa
     }, 3000);
 
     return () => clearInterval(showButtonInterval);
-  }, [winner]);
+  }, [winner, timedOut]);
 
   useEffect(() => {
     const interval = setInterval(() => {
@@ -149,7 +158,7 @@ export default function BattleArena({ battleId, userId, opponentId, apiUrl, onBa
     setButtonClicked(true);
     
     try {
-      const response = await fetch(apiUrl, {
+      const response = await apiFetch(apiUrl, {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify({
@@ -195,7 +204,7 @@ export default function BattleArena({ battleId, userId, opponentId, apiUrl, onBa
     }
 
     try {
-      const response = await fetch(apiUrl, {
+      const response = await apiFetch(apiUrl, {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify({
@@ -255,11 +264,17 @@ export default function BattleArena({ battleId, userId, opponentId, apiUrl, onBa
     }
   };
 
-  if (winner) {
+  if (winner || timedOut) {
     return (
       <div className="min-h-screen flex items-center justify-center p-4 bg-gradient-to-br from-background via-purple-950/20 to-background">
         <Card className="p-12 text-center max-w-md bg-card/50 backdrop-blur-xl neon-border">
-          {winner === userId ? (
+          {timedOut ? (
+            <>
+              <Icon name="Clock" size={80} className="text-muted-foreground mx-auto mb-6" />
+              <h2 className="text-4xl font-black mb-4">DRAW</h2>
+              <p className="text-muted-foreground">Nobody attacked before the battle timed out.</p>
+            </>
+          ) : winner === userId ? (
             <>
               <Icon name="Trophy" size={80} className="text-yellow-400 mx-auto mb-6 animate-bounce" />
               <h2 className="text-4xl font-black neon-text mb-4">VICTORY!</h2>
@@ -1,4 +1,5 @@
 import { useEffect, useState } from 'react';
+import { apiFetch } from '@/lib/api';
 import { Button } from '@/components/ui/button';
 import { Card } from '@/components/ui/card';
 import { Badge } from '@/components/ui/badge';
@@ -36,7 +37,7 @@ export default function InventoryScreen({ userId, apiUrl, onBack, currentUser, u
 
   const fetchInventory = async () => {
     try {
-      const response = await fetch(`${apiUrl}?action=inventory&user_id=${userId}`);
+      const response = await apiFetch(`${apiUrl}?action=inventory&user_id=${userId}`);
       const data = await response.json();
       setInventory(data.inventory || []);
     } catch (error) {
@@ -48,7 +49,7 @@ export default function InventoryScreen({ userId, apiUrl, onBack, currentUser, u
 
   const fetchSlots = async () => {
     try {
-      const response = await fetch(`${apiUrl}?action=get_user_slots&user_id=${userId}`);
+      const response = await apiFetch(`${apiUrl}?action=get_user_slots&user_id=${userId}`);
       const data = await response.json();
       if (data.success) {
         setSlot2Unlocked(data.slot2_unlocked);
@@ -73,7 +74,7 @@ export default function InventoryScreen({ userId, apiUrl, onBack, currentUser, u
     }
 
     try {
-      const response = await fetch(apiUrl, {
+      const response = await apiFetch(apiUrl, {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify({
@@ -100,7 +101,7 @@ export default function InventoryScreen({ userId, apiUrl, onBack, currentUser, u
 
   const handleEquip = async (powerId: number, slot: number) => {
     try {
-      const response = await fetch(apiUrl, {
+      const response = await apiFetch(apiUrl, {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify({
@@ -126,7 +127,7 @@ export default function InventoryScreen({ userId, apiUrl, onBack, currentUser, u
 
   const handleUnequip = async (powerId: number) => {
     try {
-      const response = await fetch(apiUrl, {
+      const response = await apiFetch(apiUrl, {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify({
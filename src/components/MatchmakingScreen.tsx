@@ -1,4 +1,5 @@
 import { useEffect, useState } from 'react';
+import { apiFetch } from '@/lib/api';
 import { Button } from '@/components/ui/button';
 import { Card } from '@/components/ui/card';
 import { Progress } from '@/components/ui/progress';
@@ -18,7 +19,7 @@ export default function MatchmakingScreen({ userId, apiUrl, onMatchFound, onCanc
   useEffect(() => {
     const startSearch = async () => {
       try {
-        const response = await fetch(apiUrl, {
+        const response = await apiFetch(apiUrl, {
           method: 'POST',
           headers: { 'Content-Type': 'application/json' },
           body: JSON.stringify({ action: 'find_match', user_id: userId }),
@@ -47,7 +48,7 @@ export default function MatchmakingScreen({ userId, apiUrl, onMatchFound, onCanc
 
     const checkMatch = setInterval(async () => {
       try {
-        const response = await fetch(`${apiUrl}?action=check_match&user_id=${userId}`);
+        const response = await apiFetch(`${apiUrl}?action=check_match&user_id=${userId}`);
         const data = await response.json();
         
         if (data.matched && data.battle_id) {
@@ -69,7 +70,7 @@ export default function MatchmakingScreen({ userId, apiUrl, onMatchFound, onCanc
   useEffect(() => {
     if (seconds >= maxSeconds) {
       const cancelSearch = async () => {
-        await fetch(apiUrl, {
+        await apiFetch(apiUrl, {
           method: 'POST',
           headers: { 'Content-Type': 'application/json' },
           body: JSON.stringify({ action: 'cancel_search', user_id: userId }),
@@ -1,4 +1,5 @@
 import { useEffect, useState } from 'react';
+import { apiFetch } from '@/lib/api';
 import { Button } from '@/components/ui/button';
 import { Card } from '@/components/ui/card';
 import { Badge } from '@/components/ui/badge';
@@ -33,7 +34,7 @@ export default function PowersCatalog({ apiUrl, onBack }: PowersCatalogProps) {
   useEffect(() => {
     const fetchPowers = async () => {
       try {
-        const response = await fetch(`${apiUrl}?action=catalog`);
+        const response = await apiFetch(`${apiUrl}?action=catalog`);
         const data = await response.json();
         setPowers(data.powers || []);
       } catch (error) {
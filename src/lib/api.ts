@@ -0,0 +1,22 @@
+// Reads may be served by a database replica. After a write the backend returns
+// X-Primary-Until; echoing it keeps our reads on the primary until then, so we
+// see our own writes whichever function or instance answers.
+const PRIMARY_PIN_MS = 15000;
+
+let primaryUntil: string | null = null;
+let pinnedAt = 0;
+
+export async function apiFetch(input: string, init: RequestInit = {}): Promise<Response> {
+  const headers = new Headers(init.headers);
+  if (primaryUntil && Date.now() - pinnedAt < PRIMARY_PIN_MS) {
+    headers.set('X-Primary-Until', primaryUntil);
+  }
+
+  const response = await fetch(input, { ...init, headers });
+  const until = response.headers.get('X-Primary-Until');
+  if (until) {
+    primaryUntil = until;
+    pinnedAt = Date.now();
+  }
+  return response;
+}
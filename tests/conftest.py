@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Backend functions are deployed as flat directories and import their modules by name
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend', 'game'))
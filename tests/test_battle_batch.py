@@ -0,0 +1,159 @@
+import json
+import random
+import time
+
+import index
+from battle_log import (encode_action, decode_log, resolve_batch, ACTION_ATTACK, ACTION_POWER_ATTACK,
+                        ACTION_SHIELD, ACTION_COUNTER)
+from rules import (new_battle_state, resolve_attack, activate_shield, activate_counter, winner_slot,
+                   BASE_ATTACK_DAMAGE)
+
+WINDOW_START = 10000
+WINDOW_END = 12000
+
+
+def resolve_one_by_one(events):
+    '''What the single-action handlers do when every action arrives at its own timestamp;
+    a power used again before its cooldown is over is refused, as battle_cooldowns does'''
+    state = new_battle_state()
+    can_use_at = {}
+    outcomes = []
+    on_cooldown = 0
+    for ts, player, kind, power_id, amount, cooldown in events:
+        if winner_slot(state):
+            outcomes.append(('rejected', 0))
+            continue
+        if power_id and ts < can_use_at.get((player, power_id), 0):
+            outcomes.append(('rejected', 0))
+            on_cooldown += 1
+            continue
+        if power_id:
+            can_use_at[(player, power_id)] = ts + cooldown * 1000
+        
+        if kind in (ACTION_ATTACK, ACTION_POWER_ATTACK):
+            outcome = resolve_attack(state, player, amount, ts)
+        elif kind == ACTION_SHIELD:
+            activate_shield(state, player, amount, ts)
+            outcome = ('shield', 0)
+        else:
+            activate_counter(state, player, amount, ts)
+            outcome = ('counter', 0)
+        outcomes.append(outcome)
+    return state, outcomes, on_cooldown
+
+
+def random_action(rng, ts, player):
+    # Few power ids and short cooldowns, so powers are often reused while cooling down
+    kind = rng.choice([ACTION_ATTACK, ACTION_ATTACK, ACTION_POWER_ATTACK, ACTION_SHIELD, ACTION_COUNTER])
+    if kind == ACTION_ATTACK:
+        return (ts, player, kind, 0, BASE_ATTACK_DAMAGE, 0)
+    power_id = kind * 10 + rng.randint(0, 1)
+    cooldown = rng.randint(0, 3)
+    if kind == ACTION_SHIELD:
+        return (ts, player, kind, power_id, rng.randint(1, 3), cooldown)
+    return (ts, player, kind, power_id, rng.randint(5, 20), cooldown)
+
+
+def test_batch_matches_clicks_resolved_one_by_one():
+    rng = random.Random(1234)
+    cooldown_rejections = 0
+    for _ in range(2000):
+        attacker = rng.choice([1, 2])
+        history = [random_action(rng, rng.randrange(0, WINDOW_START), rng.choice([1, 2]))
+                   for _ in range(rng.randint(0, 20))]
+        opponent = [random_action(rng, rng.randrange(WINDOW_START, WINDOW_END), 3 - attacker)
+                    for _ in range(rng.randint(0, 4))]
+        clicks = [rng.randrange(WINDOW_START, WINDOW_END) for _ in range(rng.randint(1, 10))]
+        
+        # The opponent's actions in the window were committed before the batch arrived
+        logged = sorted(history + opponent, key=lambda record: record[0])
+        log = b''.join(encode_action(*record) for record in logged)
+        state, outcomes, _ = resolve_batch(log, attacker, clicks, BASE_ATTACK_DAMAGE)
+        
+        # Clicks land no earlier than the opponent's latest logged action and sort after
+        # logged actions with the same timestamp, as in resolve_batch
+        floor = max((record[0] for record in logged if record[1] != attacker), default=0)
+        clicked = [(max(ts, floor), attacker, ACTION_ATTACK, 0, BASE_ATTACK_DAMAGE, 0) for ts in sorted(clicks)]
+        events = sorted([(record, False) for record in logged] + [(record, True) for record in clicked],
+                        key=lambda event: event[0][0])
+        expected_state, expected_outcomes, on_cooldown = resolve_one_by_one([record for record, _ in events])
+        click_outcomes = [outcome for (_, is_click), outcome in zip(events, expected_outcomes) if is_click]
+        cooldown_rejections += on_cooldown
+        
+        assert (state['player1_hp'], state['player2_hp']) == \
+            (expected_state['player1_hp'], expected_state['player2_hp'])
+        assert outcomes == click_outcomes
+    
+    assert cooldown_rejections > 0
+
+
+def test_click_backdated_before_a_logged_counter_is_countered():
+    now = WINDOW_END
+    log = encode_action(now - 100, 2, ACTION_COUNTER, 30, 15, 0)
+    state, outcomes, records = resolve_batch(log, 1, [now - 1900], BASE_ATTACK_DAMAGE)
+    
+    assert outcomes == [('countered', 15)]
+    assert state['player1_hp'] == 100 - 15
+    assert [record[0] for record in decode_log(records)] == [now - 100]
+
+
+def test_click_backdated_before_a_logged_shield_is_blocked():
+    now = WINDOW_END
+    log = encode_action(now - 500, 2, ACTION_SHIELD, 20, 3, 0)
+    state, outcomes, _ = resolve_batch(log, 1, [now - 1500, now - 200], BASE_ATTACK_DAMAGE)
+    
+    assert outcomes == [('blocked', 0), ('blocked', 0)]
+    assert state['player2_hp'] == 100
+
+
+class FakeCursor:
+    '''Records statements and answers the battle row lock of attack_batch'''
+
+    def __init__(self, battle):
+        self.battle = battle
+        self.executed = []
+
+    def execute(self, sql, params=None):
+        self.executed.append((sql, params))
+
+    def fetchone(self):
+        return dict(self.battle) if self.executed[-1][0] == index.ATTACK_BATCH_BATTLE_SQL else None
+
+
+class FakeConnection:
+    def __init__(self):
+        self.commits = 0
+
+    def commit(self):
+        self.commits += 1
+
+
+def test_attack_batch_persists_the_resolved_state_and_appends_the_clicks():
+    now = int(time.time() * 1000)
+    log = encode_action(now - 1000, 2, ACTION_ATTACK, 0, BASE_ATTACK_DAMAGE, 0)
+    cur = FakeCursor({'player1_id': 11, 'player2_id': 22, 'player1_hp': 100 - BASE_ATTACK_DAMAGE,
+                      'player2_hp': 100, 'status': 'active', 'action_log': log})
+    conn = FakeConnection()
+    
+    response = index.handle_attack_batch(cur, conn, 5, 11, [now - 1900, now - 100])
+    body = json.loads(response['body'])
+    
+    assert response['statusCode'] == 200
+    assert (body['applied'], body['hits'], body['player2_hp']) == (2, 2, 100 - 2 * BASE_ATTACK_DAMAGE)
+    (sql, params), = [(sql, params) for sql, params in cur.executed if sql.startswith('UPDATE battles')]
+    assert params[:8] == (100 - BASE_ATTACK_DAMAGE, 100 - 2 * BASE_ATTACK_DAMAGE, 0, 0, 0, 0, 0, 0)
+    appended = list(decode_log(bytes(params[8].adapted)))
+    assert [record[0] for record in appended] == [now - 1000, now - 100]
+    assert all(record[1:3] == (1, ACTION_ATTACK) for record in appended)
+    assert conn.commits == 1
+
+
+def test_attack_batch_refuses_a_battle_older_than_its_log():
+    # Active before V0008: HP already changed but the log is empty
+    cur = FakeCursor({'player1_id': 11, 'player2_id': 22, 'player1_hp': 60, 'player2_hp': 100,
+                      'status': 'active', 'action_log': b''})
+    
+    response = index.handle_attack_batch(cur, FakeConnection(), 5, 11, [int(time.time() * 1000)])
+    
+    assert response['statusCode'] == 409
+    assert not [sql for sql, _ in cur.executed if sql.startswith('UPDATE')]
@@ -0,0 +1,59 @@
+import time
+
+import pytest
+
+import db
+
+
+class FakeConnection:
+    def __init__(self, url):
+        self.url = url
+        self.closed = False
+
+    def get_transaction_status(self):
+        return db.extensions.TRANSACTION_STATUS_IDLE
+    
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def replica(monkeypatch):
+    '''Two databases configured, connections opened by a fake psycopg2.connect'''
+    monkeypatch.setattr(db, 'DATABASE_READ_URL', 'replica-url')
+    monkeypatch.setattr(db, '_urls', {'primary': 'primary-url', 'replica': 'replica-url'})
+    monkeypatch.setattr(db, '_conns', {})
+    monkeypatch.setattr(db, '_released_at', {})
+    monkeypatch.setattr(db.psycopg2, 'connect', FakeConnection)
+
+
+def test_reads_go_to_the_replica_and_writes_to_the_primary(replica):
+    assert db.get_connection(read_only=True).url == 'replica-url'
+    assert db.get_connection(read_only=False).url == 'primary-url'
+    
+    # A released connection is reused by the next request of its role
+    conn = db.get_connection(read_only=True)
+    db.release_connection(conn)
+    assert db.get_connection(read_only=True) is conn
+
+
+def test_reads_stay_on_the_primary_until_the_pin_expires(replica):
+    pinned_until = db.primary_until()
+    
+    assert int(pinned_until) > time.time() * 1000
+    assert db.get_connection(read_only=True, pinned_until=pinned_until).url == 'primary-url'
+    expired = str(int(time.time() * 1000) - 1)
+    assert db.get_connection(read_only=True, pinned_until=expired).url == 'replica-url'
+
+
+@pytest.mark.parametrize('value', [None, '', 'soon', '1.5e13', ' '])
+def test_invalid_pins_are_ignored(replica, value):
+    assert not db.is_pinned(value)
+    assert db.get_connection(read_only=True, pinned_until=value).url == 'replica-url'
+
+
+def test_without_a_replica_everything_uses_the_primary(replica, monkeypatch):
+    monkeypatch.setattr(db, 'DATABASE_READ_URL', None)
+    
+    assert db.primary_until() is None
+    assert db.get_connection(read_only=True).url == 'primary-url'
@@ -0,0 +1,18 @@
+import base64
+import gzip
+
+from response import success_response, finalize_response
+
+
+def test_identity_and_gzip_bodies_share_a_weak_etag():
+    response = success_response({'items': ['x' * 50] * 50})
+    plain = finalize_response({'httpMethod': 'GET', 'headers': {}}, response)
+    zipped = finalize_response({'httpMethod': 'GET', 'headers': {'Accept-Encoding': 'gzip'}}, response)
+    
+    assert plain['headers']['ETag'].startswith('W/"')
+    assert zipped['headers']['ETag'] == plain['headers']['ETag']
+    assert gzip.decompress(base64.b64decode(zipped['body'])).decode() == plain['body']
+    
+    revalidated = finalize_response(
+        {'httpMethod': 'GET', 'headers': {'If-None-Match': f'"other", {plain["headers"]["ETag"]}'}}, response)
+    assert revalidated['statusCode'] == 304
@@ -0,0 +1,10 @@
+from throttle import ActionThrottle
+
+
+def test_batched_clicks_share_the_attack_bucket():
+    throttle = ActionThrottle({'attack': (10.0, 15.0)}, shared={'attack_batch': 'attack'})
+    
+    assert throttle.check(1, 'attack_batch', cost=10)[0] == 'ok'
+    assert throttle.check(1, 'attack_batch', cost=10)[0] == 'limited'
+    assert [throttle.check(1, 'attack')[0] for _ in range(6)] == ['ok'] * 5 + ['limited']
+    assert throttle.stats()['actions']['attack_batch'] == {'allowed': 1, 'limited': 1, 'duplicates': 0}